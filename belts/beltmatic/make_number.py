@@ -1,14 +1,79 @@
+import argparse
+import array
+import asyncio
+import concurrent.futures
+import contextlib
 import functools
+import hashlib
 import heapq
 import itertools
+import json
 import math
+import mmap
+import multiprocessing
+import os
+import re
+import signal
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import threading
 import time
 from collections import defaultdict
+from collections.abc import Mapping
+from multiprocessing import resource_tracker, shared_memory
+
+try:
+    import numpy as np
+except ImportError:
+    # Everything still works without it, just one edge at a time
+    np = None
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows, search stats just go without peak memory there
+    resource = None
 
 MAX_INT = 2147483647
 MIN_INT = -2147483648
+# The operators the solvers can use, see use_operators()
+OPERATOR_SYMBOLS = ['+', '*', '-', '/', '^']
+# Same order path_cmp ranks operators in
+OPERATOR_CODES = {None:0, '':0, '+':1, '*':2, '-':3, '/':4, '^':5}
+OPERATORS_BY_CODE = [None, '+', '*', '-', '/', '^']
+OCCURENCE_BITS = 32
+OCCURENCE_MASK = (1 << OCCURENCE_BITS)-1
+# A path's operands and operator codes, packed this many bits each into one
+# int, compare the way their lists do as long as the lengths are equal
+OPERAND_BITS = 32
+CODE_BITS = 3
+# Paths spilled to disk by FrontierSpill, (value, operator code, operand)
+# per node after how many nodes there are
+SPILL_LENGTH = struct.Struct('<I')
+SPILL_RECORD = struct.Struct('<IBI')
+# Spreads values over sharded_set_solution()'s shards
+SHARD_HASH = 0x9E3779B1
+# How many paths a shard keeps around to build the ones it gets on
+SHARD_PREFIXES = 1 << 18
+# NumberIndex factors anything up to this with a sieve, past it divisors
+# come from trying every operand
+SIEVE_LIMIT = 1 << 20
+# The one sieve every NumberIndex in this process shares, see shared_sieve()
+SIEVE = array.array('I', [0, 1])
+# How many pops between looking at memory_in_use() when there's a limit
+SPILL_CHECK_POPS = 1024
+# Below this many edges NumPy's overhead costs more than it saves
+NUMPY_MIN_EDGES = 128
+# Below this many targets starting a process pool takes longer than the
+# solving does, so the sorts just solve them one by one
+POOL_MIN_TARGETS = 16
 
 class LinkedNode:
+    __slots__ = ('value', 'parent_node')
+
     def __init__(self, value, parent_node=None):
         self.value = value
         self.parent_node = parent_node
@@ -20,6 +85,8 @@ class LinkedNode:
         return f"LinkedNode({self.value})"
 
 class ImmutableLinkedList:
+    __slots__ = ('head', 'tail', 'length')
+
     def __init__(self, iterable=None):
         self.head = None
         self.tail = None
@@ -128,107 +195,188 @@ class ImmutableLinkedList:
         copied.length = self.length+1
         return copied
 
+class ExpressionNode(LinkedNode):
+    # Same as a LinkedNode holding (value, (operator, operand)), but with the
+    # operator kept as an integer so comparisons don't go through strings
+    __slots__ = ('operator_code',)
+
+    def __init__(self, value, parent_node=None):
+        super().__init__(value, parent_node)
+        self.operator_code = OPERATOR_CODES[value[1][0]] if value[1] is not None else 0
+
+def mask_ranks(mask):
+    # Operands are stored as bits, where bit n means the operand ranked n
+    # (see OperandRanks) was used
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length()-1
+        mask ^= lowest
+
+class OperandRanks:
+    # Which bit of ExpressionPath.operand_mask (and which field of
+    # occurence_counts) belongs to which operand, so their size goes with how
+    # many operands there are and not how big they are
+    # A search's paths all share the one for its allowed numbers (ranked
+    # smallest first, see operand_ranks()), anything else gets one for its
+    # own operands. Appending an operand that isn't ranked yet ranks it last
+    # in a new one, so everything already packed means the same there
+    # high_bits is the top bit of every field, see MeetingPaths.beats()
+    __slots__ = ('operands', 'ranks', 'high_bits', 'extensions')
+
+    def __init__(self, operands):
+        self.operands = tuple(operands)
+        self.ranks = dict((operand, rank) for rank, operand in enumerate(self.operands))
+        self.high_bits = sum(1 << (rank*OCCURENCE_BITS+OCCURENCE_BITS-1) for rank in range(len(self.operands)))
+        self.extensions = dict()
+
+    def extended(self, operand):
+        if operand not in self.extensions:
+            self.extensions[operand] = OperandRanks(self.operands+(operand,))
+        return self.extensions[operand]
+
+    def mask(self, operands):
+        # The bits for whichever of operands are ranked
+        return sum(1 << self.ranks[operand] for operand in set(operands) if operand in self.ranks)
+
+    def mask_operands(self, mask):
+        for rank in mask_ranks(mask):
+            yield self.operands[rank]
+
+@functools.lru_cache(maxsize=1<<8)
+def sorted_operand_ranks(operands):
+    return OperandRanks(operands)
+
+def operand_ranks(using):
+    # The OperandRanks for using, the same one every time as long as it's
+    # cached, so paths from different calls can share it
+    return sorted_operand_ranks(tuple(sorted(set(using))))
+
 class ExpressionPath(ImmutableLinkedList):
-    def __init__(self, lst, belts_per_source=None):
+    # Millions of these get made per search, so everything appended() needs is
+    # kept as a handful of ints instead of a dict per path
+    # occurence_counts packs how often each operand was used into one int,
+    # OCCURENCE_BITS bits per operand starting at bit rank*OCCURENCE_BITS
+    # (its rank in operand_ranks, same for operand_mask), so using an operand
+    # again is a single add instead of copying a dict
+    # encoded_operands and encoded_codes are operand_list() and
+    # operator_codes() packed into ints (OPERAND_BITS and CODE_BITS each), so
+    # cmp_key() is a plain tuple without going through the nodes
+    __slots__ = ('belts_per_source', 'operand_ranks', 'occurence_counts', 'operand_mask', 'calculated_sources',
+                 'calculated_sum', 'calculated_max_occurence', 'calculated_max_operand',
+                 'calculated_set_sum', 'encoded_operands', 'encoded_codes', 'calculated_key')
+    # ExpressionEnds list their nodes last appended first
+    prepends = False
+
+    def __init__(self, lst, belts_per_source=None, ranks=None):
         if isinstance(lst, ExpressionPath):
             self.head = lst.head
             self.tail = lst.tail
             self.length = lst.length
-            self.calculated_sum = lst.calculated_sum
-            self.occurences = lst.occurences
-            self.calculated_sources = lst.calculated_sources
             self.belts_per_source = lst.belts_per_source
+            self.operand_ranks = lst.operand_ranks
+            self.occurence_counts = lst.occurence_counts
+            self.operand_mask = lst.operand_mask
+            self.calculated_sources = lst.calculated_sources
+            self.calculated_sum = lst.calculated_sum
             self.calculated_max_occurence = lst.calculated_max_occurence
             self.calculated_max_operand = lst.calculated_max_operand
+            self.calculated_set_sum = lst.calculated_set_sum
+            self.encoded_operands = lst.encoded_operands
+            self.encoded_codes = lst.encoded_codes
+            self.calculated_key = lst.calculated_key
+            return
+        self.head = None
+        self.tail = None
+        self.length = 0
+        self.belts_per_source = belts_per_source
+        if ranks is None:
+            lst = list(lst)
+            ranks = operand_ranks(edge[1] for _, edge in lst)
+        self.operand_ranks = ranks
+        self.occurence_counts = 0
+        self.operand_mask = 0
+        self.calculated_sources = 0
+        self.calculated_sum = 0
+        self.calculated_max_occurence = 0
+        self.calculated_max_operand = None
+        self.calculated_set_sum = 0
+        self.encoded_operands = 0
+        self.encoded_codes = 0
+        self.calculated_key = None
+        for item in lst:
+            assert isinstance(item, tuple)
+            assert len(item) == 2
+            self.add_node(self, item)
+
+    def add_node(self, previous, value):
+        # Fills self in as previous with value appended, in O(1)
+        # previous can be self, so anything of it that's needed is read first
+        new_node = ExpressionNode(value, previous.tail)
+        length = previous.length
+        operand = value[1][1]
+        ranks = previous.operand_ranks
+        rank = ranks.ranks.get(operand)
+        if rank is None:
+            ranks = ranks.extended(operand)
+            rank = ranks.ranks[operand]
+        self.operand_ranks = ranks
+        self.calculated_set_sum = previous.calculated_set_sum
+        if not previous.operand_mask >> rank & 1:
+            self.calculated_set_sum += operand
+        if previous.head is None:
+            self.head = new_node
         else:
-            super().__init__(lst)
-            for item in lst:
-                assert isinstance(item, tuple)
-                assert len(item) == 2
-            self.calculated_sum = None
-            self.occurences = None
-            self.calculated_sources = None
-            self.belts_per_source = belts_per_source
-            self.calculated_max_occurence = None
-            self.calculated_max_operand = None
+            self.head = previous.head
+        self.tail = new_node
+        self.length = length+1
+
+        shift = rank*OCCURENCE_BITS
+        self.occurence_counts = previous.occurence_counts + (1 << shift)
+        self.operand_mask = previous.operand_mask | (1 << rank)
+        if self.prepends:
+            self.encoded_operands = previous.encoded_operands | (operand << length*OPERAND_BITS)
+            self.encoded_codes = previous.encoded_codes | (new_node.operator_code << length*CODE_BITS)
+        else:
+            self.encoded_operands = (previous.encoded_operands << OPERAND_BITS) | operand
+            self.encoded_codes = (previous.encoded_codes << CODE_BITS) | new_node.operator_code
+        self.calculated_key = None
+        occurence = (self.occurence_counts >> shift) & OCCURENCE_MASK
+        self.calculated_sources = previous.calculated_sources
+        if self.belts_per_source is not None and occurence % self.belts_per_source == 1 % self.belts_per_source:
+            # Went over what the last source could supply
+            self.calculated_sources += 1
+        self.calculated_sum = previous.calculated_sum + operand
+        self.calculated_max_occurence = max(previous.calculated_max_occurence, occurence)
+        if previous.calculated_max_operand is None or operand > previous.calculated_max_operand:
+            self.calculated_max_operand = operand
+        else:
+            self.calculated_max_operand = previous.calculated_max_operand
 
-    
     def operand_occurences(self) -> defaultdict:
-        if self.occurences is None:
-            # print("Shouldn't be here often")
-            self.occurences = defaultdict(lambda: 0)
-            for operand in self.operand_list():
-                assert isinstance(operand, int)
-                self.occurences[operand] += 1
-        return self.occurences
+        occurences = defaultdict(lambda: 0)
+        for operand in self.operand_ranks.mask_operands(self.operand_mask):
+            occurences[operand] = self.occurence(operand)
+        return occurences
+
+    def occurence(self, operand):
+        rank = self.operand_ranks.ranks.get(operand)
+        if rank is None:
+            return 0
+        return (self.occurence_counts >> (rank*OCCURENCE_BITS)) & OCCURENCE_MASK
 
     def sources(self):
         assert self.belts_per_source != None
-        if self.calculated_sources is None:
-            occurences = self.operand_occurences()
-            # t0 = time.time()
-            self.calculated_sources = sum([math.ceil(value/self.belts_per_source) for value in occurences.values()])
-            # print([math.ceil(value/belts_per_source) for value in occurences.values()])
-            # print([occurences.values()])
-            # print(f"{self} has {self.calculated_sources} source(s) now")
-            # if len(self) > 1: assert False
-            # t1 = time.time()
-            # print(f"Sum took {round(t1-t0, 3)}s")
-            # assert t1-t0<1
         return self.calculated_sources
 
     def sum(self):
-        if self.calculated_sum is None:
-            # print("Shouldn't be here often")
-            self.calculated_sum = sum(operand*occurence_number for operand, occurence_number in self.operand_occurences().items())
         return self.calculated_sum
 
-    # def appended(self, item):
-    #     # print(self, item)
-    #     operand = item[1][1]
-    #     self.calculated_sum = self.sum() + operand
-    #     self.occurences[operand] += 1
-    #     if self.occurences[operand]%self.belts_per_source==1:
-    #         self.calculated_sources += 1
-    #     return super().appended(item)
-    
     def appended(self, value):
         assert isinstance(value, tuple)
         assert len(value) == 2
-        copied = ExpressionPath([], self.belts_per_source)
-        # t0 = time.time()
-        copied.head = self.head
-        new_node = LinkedNode(value)
-        # t1 = time.time()
-        # if round(t1-t0,3)>=0.1: print(f"Step I took {round(t1-t0, 3)}s")
-        if self.head is None:
-            copied.head = copied.tail = new_node
-        else:
-            new_node.parent_node = self.tail
-            copied.tail = new_node
-        
-        copied.length = self.length+1
-        copied.calculated_sum = self.calculated_sum
-        copied.calculated_sources = self.calculated_sources
-        
-        # t0 = time.time()
-        copied.occurences = self.operand_occurences().copy()
-        # t1 = time.time()
-        # if round(t1-t0,3)>=0.1: print(f"Step J took {round(t1-t0, 3)}s")
-        # The following is O(1)
-        operand = value[1][1]
-        copied.calculated_sum = self.sum() + operand
-        # print(copied.occurences, operand)
-        # print(copied.occurences[operand])
-        copied.occurences[operand] += 1
-        if copied.occurences[operand]%copied.belts_per_source==1:
-            copied.calculated_sources = self.sources()+1
-        copied.calculated_max_occurence = self.calculated_max_occurence
-        if copied.occurences[operand] > copied.max_occurence():
-            copied.calculated_max_occurence = copied.occurences[operand]
-        copied.calculated_max_operand = self.max_operand()
-        if copied.calculated_max_operand is None or operand > copied.calculated_max_operand:
-            copied.calculated_max_operand = operand
+        copied = object.__new__(type(self))
+        copied.belts_per_source = self.belts_per_source
+        copied.add_node(self, value)
         return copied
 
     def __str__(self):
@@ -250,18 +398,30 @@ class ExpressionPath(ImmutableLinkedList):
         return str(self)
 
     def max_occurence(self):
-        if self.calculated_max_occurence is None:
-            # if self.operand_occurences().values():
-            self.calculated_max_occurence = max(self.operand_occurences().values())
         return self.calculated_max_occurence
 
     def max_operand(self):
-        if self.calculated_max_operand is None and self.head:
-            self.calculated_max_operand = max(self.operand_set())
         return self.calculated_max_operand
 
     def operand_set(self):
-        return set(self.operand_list())
+        return set(self.operand_ranks.mask_operands(self.operand_mask))
+
+    def tie_key(self):
+        # operand_list() and operator_codes(), only comparable between paths
+        # of the same length
+        return self.encoded_operands, self.encoded_codes
+
+    def cmp_key(self):
+        # Sorts the same as path_cmp, a forward path's leading operator code
+        # is always 0 so it doesn't change anything
+        if self.calculated_key is None:
+            self.calculated_key = (self.length, self.operand_mask.bit_count(), self.calculated_max_operand,
+                                   self.calculated_set_sum, self.encoded_operands, self.encoded_codes)
+        return self.calculated_key
+
+    def set_cmp_key(self):
+        # Sorts the same as path_set_cmp
+        return (self.sources(),)+self.cmp_key()
 
     def operand_list(self):
         return [edge[1] for _,edge in self]
@@ -270,16 +430,27 @@ class ExpressionPath(ImmutableLinkedList):
         # print(path)
         return [edge[0] for _,edge in self][1:]
 
+    def operator_codes(self):
+        codes = []
+        current_node = self.tail
+        while current_node is not None:
+            codes.append(current_node.operator_code)
+            current_node = current_node.parent_node
+        return codes[-2::-1]
+
 class ExpressionEnd(ExpressionPath):
-    def __init__(self, lst, belts_per_source, first_number):
-        super().__init__(lst, belts_per_source)
+    __slots__ = ('first_number',)
+    prepends = True
+
+    def __init__(self, lst, belts_per_source, first_number, ranks=None):
+        super().__init__(lst, belts_per_source, ranks)
         self.length = len(lst)
         self.first_number = first_number
     
     def appended(self, value, first_number):
-        copied = ExpressionEnd(super().appended(value), self.belts_per_source, first_number)
+        copied = super().appended(value)
         assert isinstance(copied, ExpressionEnd)
-        # copied.first_number = first_number
+        copied.first_number = first_number
         return copied
     
     def __repr__(self):
@@ -307,10 +478,74 @@ class ExpressionEnd(ExpressionPath):
         # print(path)
         return [edge[0] for _,edge in self]
 
+    def operator_codes(self):
+        codes = []
+        current_node = self.tail
+        while current_node is not None:
+            codes.append(current_node.operator_code)
+            current_node = current_node.parent_node
+        return codes
+
 class ExpressionJoined():
+    # A start path and an end path that meet at the same value, without
+    # copying either one, so meetings can be scored before any gets joined
+    # score_key() is the cheap part of path_set_cmp's order, tie_key() the rest
     def __init__(self, start_path: ExpressionPath, end_path: ExpressionEnd):
         self.start_path = start_path
         self.end_path = end_path
+        self.calculated_key = None
+
+    def __len__(self):
+        return len(self.start_path)+len(self.end_path)
+
+    def sources(self):
+        return self.score_key()[0]
+
+    def score_key(self):
+        # (sources, length, unique operands, max operand, sum of operands)
+        # straight from both halves' packed counts
+        if self.calculated_key is None:
+            start_path, end_path = self.start_path, self.end_path
+            belts_per_source = start_path.belts_per_source
+            sources = 0
+            operand_sum = 0
+            unique = 0
+            if start_path.operand_ranks is end_path.operand_ranks or not end_path.operand_mask:
+                counts = start_path.occurence_counts + end_path.occurence_counts
+                mask = start_path.operand_mask | end_path.operand_mask
+                operands = start_path.operand_ranks.operands
+                for rank in mask_ranks(mask):
+                    occurence = (counts >> (rank*OCCURENCE_BITS)) & OCCURENCE_MASK
+                    sources += -(-occurence // belts_per_source)
+                    operand_sum += operands[rank]
+                    unique += 1
+            else:
+                # Halves from different searches, only ever a seed
+                occurences = start_path.operand_occurences()
+                for operand, occurence in end_path.operand_occurences().items():
+                    occurences[operand] += occurence
+                for operand, occurence in occurences.items():
+                    sources += -(-occurence // belts_per_source)
+                    operand_sum += operand
+                    unique += 1
+            max_operand = start_path.max_operand()
+            if end_path.max_operand() is not None:
+                max_operand = max(max_operand, end_path.max_operand())
+            self.calculated_key = (sources, len(self), unique, max_operand, operand_sum)
+        return self.calculated_key
+
+    def tie_key(self):
+        # Both halves' packed operands and operator codes, end after start
+        start_path, end_path = self.start_path, self.end_path
+        operands = (start_path.encoded_operands << len(end_path)*OPERAND_BITS) | end_path.encoded_operands
+        codes = (start_path.encoded_codes << len(end_path)*CODE_BITS) | end_path.encoded_codes
+        return operands, codes
+
+    def better_than(self, other):
+        # Same as path_set_cmp(self.to_path(), other.to_path()) < 0
+        if self.score_key() != other.score_key():
+            return self.score_key() < other.score_key()
+        return self.tie_key() < other.tie_key()
 
     def to_path(self):
         copied = self.start_path
@@ -327,6 +562,342 @@ class ExpressionJoined():
     def __str__(self):
         return str(self.to_path())
 
+class ExpressionStore:
+    # Paths that only need keeping (a cost table's) as handles into flat
+    # arrays, instead of an ExpressionPath and its linked nodes each
+    # Not for a search's start_dict: everything in it is also in the queue or
+    # visited as an ExpressionPath, and joins need those, so handles there
+    # would only add a copy
+    # A handle is the index of the path's last node, and nodes are
+    # hash-consed, so each (parent, value, operator, operand) is only ever
+    # stored once: paths that start the same share those nodes, equal paths
+    # get equal handles and comparing or hashing them is comparing ints
+    # Length, sources, operand sum and max operand are kept per node, so
+    # sorting or filtering stored paths doesn't need them rebuilt
+    # The hash table is open-addressed in an array of handle+1 (0 if empty),
+    # all in all a stored node takes a few dozen bytes
+    __slots__ = ('belts_per_source', 'parents', 'values', 'codes', 'operands', 'lengths',
+                 'calculated_sources', 'sums', 'max_operands', 'table', 'table_mask')
+
+    def __init__(self, belts_per_source=None):
+        self.belts_per_source = belts_per_source
+        self.parents = array.array('i')
+        self.values = array.array('I')
+        self.codes = array.array('B')
+        self.operands = array.array('I')
+        self.lengths = array.array('I')
+        self.calculated_sources = array.array('I')
+        self.sums = array.array('Q')
+        self.max_operands = array.array('I')
+        self.table = array.array('i', bytes(4*1024))
+        self.table_mask = 1023
+
+    def slot(self, parent, value, code, operand):
+        # Where that node is in table, or the empty slot it'd go in
+        table, table_mask = self.table, self.table_mask
+        index = hash((parent, value, code, operand)) & table_mask
+        while True:
+            entry = table[index]-1
+            if entry < 0 or (self.parents[entry] == parent and self.values[entry] == value and self.codes[entry] == code and self.operands[entry] == operand):
+                return index
+            index = (index+1) & table_mask
+
+    def node(self, parent, value, code, operand, occurence):
+        # Handle of that node, added if it's new, occurence is how many times
+        # operand is used up to and including it
+        index = self.slot(parent, value, code, operand)
+        if self.table[index]:
+            return self.table[index]-1
+        handle = len(self.values)
+        self.parents.append(parent)
+        self.values.append(value)
+        self.codes.append(code)
+        self.operands.append(operand)
+        belts_per_source = self.belts_per_source
+        if parent < 0:
+            self.lengths.append(1)
+            self.calculated_sources.append(0 if belts_per_source is None else 1)
+            self.sums.append(operand)
+            self.max_operands.append(operand)
+        else:
+            self.lengths.append(self.lengths[parent]+1)
+            added = belts_per_source is not None and occurence % belts_per_source == 1 % belts_per_source
+            self.calculated_sources.append(self.calculated_sources[parent]+added)
+            self.sums.append(self.sums[parent]+operand)
+            self.max_operands.append(max(self.max_operands[parent], operand))
+        self.table[index] = handle+1
+        if 2*len(self.values) > self.table_mask:
+            self.grow()
+        return handle
+
+    def grow(self):
+        self.table = array.array('i', bytes(8*(self.table_mask+1)))
+        self.table_mask = 2*self.table_mask+1
+        for handle in range(len(self.values)):
+            self.table[self.slot(self.parents[handle], self.values[handle], self.codes[handle], self.operands[handle])] = handle+1
+
+    def add(self, path):
+        # The handle for path (an ExpressionPath)
+        handle = -1
+        occurences = dict()
+        for value, (operator, operand) in path:
+            occurences[operand] = occurences.get(operand, 0)+1
+            handle = self.node(handle, value, OPERATOR_CODES[operator], operand, occurences[operand])
+        return handle
+
+    def append(self, parent, path):
+        # add() for path when everything but its last node is already parent
+        value, (operator, operand) = path[-1]
+        return self.node(parent, value, OPERATOR_CODES[operator], operand, path.occurence(operand))
+
+    def path(self, handle):
+        # The ExpressionPath handle stands for
+        items = []
+        while handle >= 0:
+            items.append((self.values[handle], (OPERATORS_BY_CODE[self.codes[handle]], self.operands[handle])))
+            handle = self.parents[handle]
+        return ExpressionPath(items[::-1], self.belts_per_source)
+
+    def value(self, handle):
+        return self.values[handle]
+
+    def length(self, handle):
+        return self.lengths[handle]
+
+    def sources(self, handle):
+        assert self.belts_per_source != None
+        return self.calculated_sources[handle]
+
+    def sum(self, handle):
+        return self.sums[handle]
+
+    def max_operand(self, handle):
+        return self.max_operands[handle]
+
+    def __len__(self):
+        return len(self.values)
+
+    def nbytes(self):
+        arrays = [self.parents, self.values, self.codes, self.operands, self.lengths,
+                  self.calculated_sources, self.sums, self.max_operands, self.table]
+        return sum(len(values)*values.itemsize for values in arrays)
+
+class CostTable(Mapping):
+    # What set_cost_table() returns, {target: (sources, path)} with the paths
+    # kept in an ExpressionStore and only rebuilt when they're looked up
+    def __init__(self, store, handles):
+        self.store = store
+        self.handles = handles
+
+    def __getitem__(self, target):
+        handle = self.handles[target]
+        return self.store.sources(handle), self.store.path(handle)
+
+    def __contains__(self, target):
+        return target in self.handles
+
+    def __iter__(self):
+        return iter(self.handles)
+
+    def __len__(self):
+        return len(self.handles)
+
+class MeetingPaths:
+    # What start_dict/end_dict keep per value: every path to it that could
+    # still be part of the best join, which isn't every path to it
+    # P beats Q whatever gets joined onto them if it uses every operand at
+    # most as often (so never more sources) and is shorter, or is the same
+    # length (so uses exactly as many of each) and wins on tie_key
+    # Using a subset of Q's operands for no more sources isn't enough: with 2
+    # belts per source ((1+1)+1)+1 and 1+3 both take 2, but +1 on the end
+    # takes the first to 3 and leaves the second at 2
+    # Counts are compared all at once, with the top bit of every operand's
+    # field set (OperandRanks.high_bits) nothing borrows across fields
+    __slots__ = ('paths',)
+
+    def __init__(self):
+        self.paths = dict()
+
+    def beats(self, a, b):
+        if a.operand_ranks is b.operand_ranks:
+            high_bits = a.operand_ranks.high_bits
+            if ((b.occurence_counts | high_bits)-a.occurence_counts) & high_bits != high_bits:
+                return False
+        else:
+            occurences = b.operand_occurences()
+            if any(occurence > occurences[operand] for operand, occurence in a.operand_occurences().items()):
+                return False
+        if len(a) != len(b):
+            return len(a) < len(b)
+        return a.tie_key() <= b.tie_key()
+
+    def beaten(self, node, path):
+        return any(self.beats(other, path) for other in self.paths.get(node, []))
+
+    def add(self, node, path):
+        paths = self.paths.get(node)
+        if paths is None:
+            self.paths[node] = [path]
+            return True
+        for other in paths:
+            if self.beats(other, path):
+                return False
+        paths[:] = [other for other in paths if not self.beats(path, other)]
+        paths.append(path)
+        return True
+
+    def __contains__(self, node):
+        return node in self.paths
+
+    def __getitem__(self, node):
+        return self.paths[node]
+
+    def __len__(self):
+        return sum(len(paths) for paths in self.paths.values())
+
+@contextlib.contextmanager
+def atomic_write(filename, mode='wb'):
+    # A file to write filename's new contents to, which only gets moved over
+    # filename once the block is done, so nobody ever reads half of one
+    # It's next to filename (os.replace can't move across filesystems), and
+    # if the block raises it gets deleted and filename is left as it was
+    directory = os.path.dirname(os.path.abspath(filename))
+    f = tempfile.NamedTemporaryFile(mode, dir=directory, delete=False)
+    try:
+        with f:
+            yield f
+    except BaseException:
+        os.unlink(f.name)
+        raise
+    os.replace(f.name, filename)
+
+def memory_in_use():
+    # Resident memory right now in KiB, same units as ru_maxrss on Linux
+    # /proc is Linux only, anywhere else it's the peak so far (or None)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')//1024
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return None
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class FrontierSpill:
+    # Layers of a forward queue that won't get popped for a while, on disk
+    # Each layer ((sources, length) like the search's) gets its own temporary
+    # file of paths, SPILL_RECORD per node: the value, the operator's code
+    # and the operand, after the path's length
+    # Scores aren't kept, restore() works them out again when the layer is up
+    __slots__ = ('belts_per_source', 'ranks', 'layers', 'count')
+
+    def __init__(self, belts_per_source, ranks=None):
+        self.belts_per_source = belts_per_source
+        self.ranks = ranks
+        self.layers = dict()
+        self.count = 0
+
+    def spill(self, queue, keep):
+        # Moves every entry of queue past layer keep to disk, queue stays a heap
+        kept = []
+        for entry in queue:
+            layer = entry[0][:2]
+            if layer <= keep:
+                kept.append(entry)
+                continue
+            if layer not in self.layers:
+                self.layers[layer] = tempfile.TemporaryFile()
+            self.layers[layer].write(pack_paths([entry[1]]))
+            self.count += 1
+        queue[:] = kept
+        heapq.heapify(queue)
+
+    def restore(self, queue, layer, queue_input):
+        # The layer to expand next, counting what's on disk, with anything
+        # spilled from it back in queue
+        if not self.layers:
+            return layer
+        spilled = min(self.layers)
+        if layer is not None and layer < spilled:
+            return layer
+        with self.layers.pop(spilled) as f:
+            f.seek(0)
+            data = f.read()
+        for path in unpack_paths(data, self.belts_per_source, self.ranks):
+            heapq.heappush(queue, queue_input(path))
+            self.count -= 1
+        return spilled
+
+    def __len__(self):
+        return self.count
+
+def pack_paths(paths):
+    # Forward paths as bytes, SPILL_RECORD per node after the path's length
+    records = []
+    for path in paths:
+        records.append(SPILL_LENGTH.pack(len(path)))
+        records.extend(SPILL_RECORD.pack(node, OPERATOR_CODES[operator], operand) for node, (operator, operand) in path)
+    return b''.join(records)
+
+def unpack_paths(data, belts_per_source, ranks=None):
+    # Inverse of pack_paths, ranks is the OperandRanks to build them with
+    paths = []
+    offset = 0
+    while offset < len(data):
+        path, offset = unpack_path(data, offset, belts_per_source, ranks)
+        paths.append(path)
+    return paths
+
+def unpack_path(data, offset, belts_per_source, ranks=None, prefixes=None):
+    # One path of pack_paths' from offset, and the offset after it
+    # prefixes (a dict) keeps every path built so far by its records, so a
+    # path whose start has been seen before only gets the rest appended
+    length, = SPILL_LENGTH.unpack_from(data, offset)
+    start = offset+SPILL_LENGTH.size
+    end = start+length*SPILL_RECORD.size
+    known = 0
+    path = None
+    if prefixes is not None:
+        known = length
+        while known and data[start:start+known*SPILL_RECORD.size] not in prefixes:
+            known -= 1
+        if known:
+            path = prefixes[data[start:start+known*SPILL_RECORD.size]]
+    for index in range(known, length):
+        node, code, operand = SPILL_RECORD.unpack_from(data, start+index*SPILL_RECORD.size)
+        if path is None:
+            path = ExpressionPath([(node, (None, operand))], belts_per_source, ranks)
+        else:
+            path = path.appended((node, (OPERATORS_BY_CODE[code], operand)))
+        if prefixes is not None:
+            prefixes[data[start:start+(index+1)*SPILL_RECORD.size]] = path
+    return path, end
+
+def pack_children(groups):
+    # (path, [(value, edge), ...]) per path as bytes: the path like
+    # pack_paths, then a SPILL_RECORD per child after how many there are, so
+    # a path with a few children going to the same place is only sent once
+    records = []
+    for path, children in groups:
+        records.append(pack_paths([path]))
+        records.append(SPILL_LENGTH.pack(len(children)))
+        records.extend(SPILL_RECORD.pack(node, OPERATOR_CODES[operator], operand) for node, (operator, operand) in children)
+    return b''.join(records)
+
+def unpack_children(data, belts_per_source, ranks=None, prefixes=None):
+    # Inverse of pack_children, every child appended to its path
+    # prefixes is unpack_path's
+    paths = []
+    offset = 0
+    while offset < len(data):
+        path, offset = unpack_path(data, offset, belts_per_source, ranks, prefixes)
+        count, = SPILL_LENGTH.unpack_from(data, offset)
+        offset += SPILL_LENGTH.size
+        for _ in range(count):
+            node, code, operand = SPILL_RECORD.unpack_from(data, offset)
+            offset += SPILL_RECORD.size
+            paths.append(path.appended((node, (OPERATORS_BY_CODE[code], operand))))
+    return paths
+
 def operate(symbol, a, b):
     assert a > 0 and b > 0
     assert a==a//1 and b==b//1
@@ -350,6 +921,137 @@ def operate(symbol, a, b):
         case _:
             return None
 
+@functools.lru_cache(maxsize=None)
+def higher_powers():
+    # {(value, exponent): root} for every root**exponent up to MAX_INT with
+    # root and exponent at least 2, besides squares (math.isqrt does those)
+    # Only a couple thousand of them, cubes mostly
+    powers = dict()
+    exponent = 3
+    while 2**exponent <= MAX_INT:
+        root = 2
+        while root**exponent <= MAX_INT:
+            powers[(root**exponent, exponent)] = root
+            root += 1
+        exponent += 1
+    return powers
+
+def integer_root(value, exponent):
+    # The whole number root with root**exponent == value, None if there isn't
+    # one, exactly (no floats) for anything up to MAX_INT
+    if exponent == 1 or value == 1:
+        return value
+    if exponent == 2:
+        root = math.isqrt(value)
+        return root if root*root == value else None
+    return higher_powers().get((value, exponent))
+
+def integer_roots_array(values, exponent):
+    # integer_root() over an int64 array, with values where there isn't one
+    if exponent == 1:
+        return values
+    if exponent == 2:
+        # Floats are only off by one at most this far down, so fix that up
+        roots = np.sqrt(values.astype(np.float64)).astype(np.int64)
+        roots -= roots*roots > values
+        roots += (roots+1)*(roots+1) <= values
+        return np.where(roots*roots == values, roots, values)
+    powers = higher_power_table(exponent)
+    if len(powers) == 0:
+        return values
+    indices = np.minimum(np.searchsorted(powers, values), len(powers)-1)
+    return np.where(powers[indices] == values, indices+2, values)
+
+@functools.lru_cache(maxsize=None)
+def higher_power_table(exponent):
+    # 2**exponent, 3**exponent, ... up to MAX_INT as a sorted array, so the
+    # root of the one at index i is i+2
+    powers = []
+    root = 2
+    while root**exponent <= MAX_INT:
+        powers.append(root**exponent)
+        root += 1
+    return np.array(powers, dtype=np.int64)
+
+@functools.lru_cache(maxsize=4)
+def smallest_prime_factors(limit):
+    # Sieve of the smallest prime factor of everything up to limit (0 and 1
+    # map to themselves), as 4 byte ints instead of a list of int objects
+    # Primes get written over their multiples biggest first, so whatever's
+    # left is the smallest, one slice assignment per prime
+    small = math.isqrt(limit)
+    composite = bytearray(small+1)
+    primes = []
+    for prime in range(2, small+1):
+        if not composite[prime]:
+            primes.append(prime)
+            composite[prime*prime::prime] = b'\1'*len(range(prime*prime, small+1, prime))
+    if np is not None:
+        factors = np.arange(limit+1, dtype=np.uint32)
+        for prime in reversed(primes):
+            factors[prime*prime::prime] = prime
+        return array.array('I', factors.tobytes())
+    factors = array.array('I', range(limit+1))
+    for prime in reversed(primes):
+        factors[prime*prime::prime] = array.array('I', [prime])*len(range(prime*prime, limit+1, prime))
+    return factors
+
+def shared_sieve(limit):
+    # smallest_prime_factors() up to at least limit, kept in SIEVE so it's
+    # only built again when something needs a bigger one
+    global SIEVE
+    if len(SIEVE) <= limit:
+        SIEVE = smallest_prime_factors(limit)
+    return SIEVE
+
+class NumberIndex:
+    # What going backwards needs to know about a value, looked up instead of
+    # tried against every operand: which operands divide it, and which are
+    # exponents it's an exact power of
+    # Values up to limit get factored with the shared_sieve(), so only their
+    # actual divisors get looked at, limit is however far the values it gets
+    # asked about can go so the sieve isn't any bigger than it needs to be
+    # Past limit it's a modulo per operand, still exact. There's no sieve for
+    # all 31 bits, that'd be 8 GiB, and a segmented one only pays off for
+    # values close together, which a backward frontier's aren't
+    # step_depths() and expand_values()' one edge at a time loop use it,
+    # NumPy batches divide by every operand at once, which is cheaper still
+    def __init__(self, operands, limit=SIEVE_LIMIT):
+        self.operands = sorted(set(operands))
+        self.operand_set = set(self.operands)
+        self.max_operand = self.operands[-1]
+        self.limit = limit
+
+    def divisors(self, value):
+        # Operands that divide value, smallest first
+        if value > self.limit:
+            return [operand for operand in self.operands if value % operand == 0]
+        factors = shared_sieve(self.limit)
+        divisors = [1]
+        while value > 1:
+            prime = factors[value]
+            power = 0
+            while value % prime == 0:
+                value //= prime
+                power += 1
+            divisors = [divisor*prime**times for divisor in divisors for times in range(power+1)
+                        if divisor*prime**times <= self.max_operand]
+        return sorted(divisor for divisor in divisors if divisor in self.operand_set)
+
+    def roots(self, value):
+        # (exponent, root) for every operand that's an exponent value is an
+        # exact power of, besides 1
+        roots = []
+        for exponent in self.operands:
+            if exponent == 1:
+                continue
+            if 2**exponent > value:
+                break
+            root = integer_root(value, exponent)
+            if root is not None:
+                roots.append((exponent, root))
+        return roots
+
 def invert(symbol, b, c):
     # func is the operation used to get from b to a
     # a is the target side
@@ -392,28 +1094,329 @@ def invert(symbol, b, c):
                 return c
             return c * b
         case '^':
-            # If a**b==c, c^(1/b)
-            a_guess = round(c ** (1/b))
-            if a_guess**b==c:
-                if a_guess>MAX_INT:
-                    return c
-                return a_guess
-            # c is not a perfect power
-            return c
+            # If a**b==c, c^(1/b), worked out exactly
+            root = integer_root(c, b)
+            if root is None:
+                # c is not a perfect power
+                return c
+            return root
         case _:
             return None
 
-def minimal_solution(target: int, using: list) -> ExpressionPath:
+def redundant_steps(before, first_edge, second_edge, after, reorder=False):
+    # True if going before -first_edge-> x -second_edge-> after can never be
+    # part of a best path, so it doesn't need expanding, forwards or backwards
+    # expand_values() already drops single steps that go nowhere (*1, /1, ^1,
+    # anything giving back the value), these are pairs of steps
+    # Back where it started (+k-k, *k/k, -k+k, (x^k) root k): the path to
+    # before is shorter and uses every operand less, so it beats this one
+    # with anything joined on, and dominance would drop it later anyway
+    # With reorder, also the same operator twice with the bigger operand
+    # first: x+b+a, x*b*a, x-b-a, x/b/a and (x^b)^a give the same as x+a+b
+    # etc., clamping at MAX_INT included, and whenever the bigger-first order
+    # is valid (x>a+b, a*b divides x) so is the smaller-first one going
+    # forwards, unless it ends on b, an allowed number. Same operands, same
+    # length, and the smaller-first one wins the tie in path_cmp
+    # That needs the smaller-first path to survive up to there, which holds
+    # when nothing gets dropped for less than a shorter path to the same
+    # value, so it's only for minimal_solution's start side. Going backwards
+    # the smaller-first order can step onto its own operand (2 from 2+2+3)
+    if after == before:
+        return True
+    return reorder and first_edge[0] == second_edge[0] and first_edge[1] > second_edge[1]
+
+def forward_context(path):
+    # (before, first_edge) for redundant_steps() when appending to path
+    last = path.tail
+    if last.parent_node is None:
+        return None, last.value[1]
+    return last.parent_node.value[0], last.value[1]
+
+def backward_context(path):
+    # (second_edge, after) for redundant_steps() when an ExpressionEnd grows
+    # backwards, None if it has no edges yet
+    if path.tail is None:
+        return None
+    after, second_edge = path.tail.value
+    return second_edge, after
+
+def expand_values(values, operands, operator_symbols=OPERATOR_SYMBOLS, backward=False, number_index=None):
+    # Every valid edge out of every value, as four lists:
+    # index into values, operator, operand, neighbor
+    # Forward it's operate(operator, value, operand), backward it's
+    # invert(operator, operand, value), and like in the solvers an edge is
+    # dropped if it gives back the value or isn't positive, or if it ends on
+    # its own operand (forward it ends on the neighbor, backward on the value)
+    # Ordered by value, then operator, then operand, same as looping over edges
+    # number_index is a NumberIndex for operands (which then have to be
+    # sorted), backward * and ^ edges get looked up in it instead of tried
+    values = list(values)
+    operands = list(operands)
+    operator_symbols = list(operator_symbols)
+    assert number_index is None or number_index.operands == operands
+    if np is None or len(values)*len(operands)*len(operator_symbols) < NUMPY_MIN_EDGES:
+        indices, operators, used_operands, neighbors = [], [], [], []
+        for index, value in enumerate(values):
+            for operator in operator_symbols:
+                if backward and number_index is not None and operator == '*':
+                    edges = [(operand, value//operand) for operand in number_index.divisors(value)]
+                elif backward and number_index is not None and operator == '^':
+                    edges = number_index.roots(value)
+                elif backward:
+                    edges = [(operand, invert(operator, operand, value)) for operand in operands]
+                else:
+                    edges = [(operand, operate(operator, value, operand)) for operand in operands]
+                for operand, neighbor in edges:
+                    if neighbor == value or (value if backward else neighbor) == operand or neighbor <= 0:
+                        continue
+                    indices.append(index)
+                    operators.append(operator)
+                    used_operands.append(operand)
+                    neighbors.append(neighbor)
+        return indices, operators, used_operands, neighbors
+    # Everything fits in int64, values and operands are at most MAX_INT so
+    # products are below 2^62 and powers are only taken when they're small
+    a = np.array(values, dtype=np.int64)[:, None]
+    b = np.array(operands, dtype=np.int64)[None, :]
+    a, b = np.broadcast_arrays(a, b)
+    results = []
+    for operator in operator_symbols:
+        if backward:
+            results.append(invert_array(operator, b, a))
+        else:
+            results.append(operate_array(operator, a, b))
+    results = np.stack(results, axis=1)
+    a = a[:, None, :]
+    b = b[:, None, :]
+    valid = (results != a) & ((a if backward else results) != b) & (results > 0)
+    indices, operator_indices, operand_indices = np.nonzero(valid)
+    operators = [operator_symbols[operator_index] for operator_index in operator_indices.tolist()]
+    return indices.tolist(), operators, np.asarray(operands)[operand_indices].tolist(), results[valid].tolist()
+
+def operate_array(symbol, a, b):
+    # operate() over int64 arrays
+    match symbol:
+        case '+':
+            return np.minimum(MAX_INT, a+b)
+        case '*':
+            return np.minimum(MAX_INT, a*b)
+        case '-':
+            return np.where(a <= b, a, a-b)
+        case '/':
+            return np.where(a % b == 0, a // b, a)
+        case '^':
+            # Anything past 2^40 gets clamped anyway, so only work those out
+            small = b*np.log2(a) < 40
+            power = np.power(np.where(small, a, 1), np.where(small, b, 1))
+            return np.where(small, np.minimum(MAX_INT, power), MAX_INT)
+
+def invert_array(symbol, b, c):
+    # invert() over int64 arrays, c is the value and b the operand
+    match symbol:
+        case '+':
+            return np.where(c < b, c, c-b)
+        case '*':
+            return np.where(c % b == 0, c // b, c)
+        case '-':
+            return np.where(c+b > MAX_INT, c, c+b)
+        case '/':
+            return np.where(c*b > MAX_INT, c, c*b)
+        case '^':
+            # One exponent at a time, there's only as many as operands
+            roots = c.copy()
+            for exponent in np.unique(b).tolist():
+                chosen = b == exponent
+                roots[chosen] = integer_roots_array(c[chosen], exponent)
+            return roots
+
+class NeighborTable:
+    # Caches expand_values() per value for the solvers that pop one path at a
+    # time, so the frontier still gets expanded in batches
+    # Values that are about to be popped get queued with expect(), and a
+    # lookup that misses expands it along with a batch of those
+    # Batches start small and double up to batch_size, so searches that end
+    # after a few pops don't pay for expanding their whole frontier
+    # Only max_cached values are kept, so a huge frontier can't blow it up
+    def __init__(self, operands, operator_symbols=OPERATOR_SYMBOLS, backward=False, batch_size=1024, max_cached=1<<16):
+        self.operands = sorted(set(operands))
+        self.operator_symbols = list(operator_symbols)
+        self.backward = backward
+        self.number_index = NumberIndex(self.operands) if backward else None
+        self.batch_size = batch_size
+        self.max_cached = max_cached
+        self.neighbors = dict()
+        self.pending = []
+        self.next_batch = 1
+
+    def expect(self, values):
+        self.pending = list(set(values))
+        self.next_batch = 1
+
+    def prefetch(self, values):
+        values = [value for value in set(values) if value not in self.neighbors]
+        if len(self.neighbors) + len(values) > self.max_cached:
+            self.neighbors.clear()
+        for value in values:
+            self.neighbors[value] = []
+        for index, operator, operand, neighbor in zip(*expand_values(values, self.operands, self.operator_symbols, self.backward, self.number_index)):
+            self.neighbors[values[index]].append(((operator, operand), neighbor))
+
+    def __getitem__(self, value):
+        if value not in self.neighbors:
+            batch = [value]
+            while self.pending and len(batch) < self.next_batch:
+                upcoming = self.pending.pop()
+                if upcoming not in self.neighbors:
+                    batch.append(upcoming)
+            self.next_batch = min(self.batch_size, self.next_batch*2)
+            self.prefetch(batch)
+        return self.neighbors[value]
+
+@functools.lru_cache(maxsize=1<<16)
+def min_steps(value, target, max_operand):
+    # Fewest operations that could possibly turn value into target, when no
+    # operand is bigger than max_operand
+    # Going up, nothing grows faster than the biggest of +, * and ^ by
+    # max_operand, and going down nothing shrinks faster than the smallest of
+    # -, / and the root, so counting steps of just those is a lower bound
+    if value == target:
+        return 0
+    if max_operand == 1:
+        # +1 and -1 are the only things that move at all
+        return abs(target-value)
+    steps = 0
+    if value < target:
+        while value < target:
+            value = max(value+max_operand, value*max_operand, value**max_operand)
+            steps += 1
+    else:
+        value = float(value)
+        while value > target:
+            # Shaved a little so float roots can't overshoot an exact one
+            value = min(value-max_operand, value/max_operand, value**(1/max_operand)*(1-1e-9))
+            steps += 1
+    return steps
+
+def step_depths(values, using, max_depth=3, backward=False, max_size=1<<14):
+    # Exact fewest steps from any of values to everything near them (or from
+    # everything near them to one of values, backward)
+    # Returns (depths, depth), anything not in depths takes more than depth
+    # Backward stops at MAX_INT, everything big enough clamps to it so there's
+    # no listing what comes before it
+    depths = dict((value, 0) for value in values)
+    frontier = list(depths)
+    depth = 0
+    # Only values less than max_depth steps back get expanded, and a step
+    # back can't make a value more than max(using)+1 times bigger
+    index = NumberIndex(using, min(SIEVE_LIMIT, max(values)*(max(using)+1)**max_depth)) if backward else None
+    while depth < max_depth and len(depths) < max_size:
+        if backward and MAX_INT in frontier:
+            break
+        new_frontier = []
+        for value in frontier:
+            if backward:
+                neighbors = []
+                for operand in using:
+                    neighbors.append(value-operand)
+                    neighbors.append(value+operand)
+                    if value*operand <= MAX_INT:
+                        neighbors.append(value*operand)
+                neighbors.extend(value//operand for operand in index.divisors(value))
+                neighbors.extend(root for _, root in index.roots(value))
+            else:
+                neighbors = [operate(symbol, value, operand) for symbol in OPERATOR_SYMBOLS for operand in using]
+            for neighbor in neighbors:
+                if neighbor > 0 and neighbor not in depths:
+                    depths[neighbor] = depth+1
+                    new_frontier.append(neighbor)
+        frontier = new_frontier
+        depth += 1
+    return depths, depth
+
+def min_added_sources(path: ExpressionPath, steps):
+    # Fewest sources steps more operands could add to path: whatever's left
+    # over on the sources it already has is free, every new one gives
+    # belts_per_source more
+    belts_per_source = path.belts_per_source
+    counts = path.occurence_counts
+    spare = 0
+    for rank in mask_ranks(path.operand_mask):
+        spare += -((counts >> (rank*OCCURENCE_BITS)) & OCCURENCE_MASK) % belts_per_source
+    return -(-max(0, steps-spare) // belts_per_source)
+
+def forward_heuristic(target, using, ranks, lower_bounds=True, pattern_db=None, require=None):
+    # The forward lower bound of set_solution_search (and every shard of
+    # sharded_set_solution), (sources, length, set_cmp_key) per path
+    # Consistent and admissable
+    # Consistent -> h(n) <= c(n,a,n')+h(n')
+    # Admissable -> h(n) <= h*(n)
+    # Consistent -> Admissable
+    # Exact steps near the target and near the numbers, min_steps() past that
+    # Near the target gets worked out per set of operands too, see heuristic
+    # pattern_db and require are the same as set_solution_search's
+    target_depths = dict()
+    def steps_to_target(node, mask):
+        if mask not in target_depths:
+            operands = list(ranks.mask_operands(mask))
+            target_depths[mask] = step_depths([target], operands, backward=True), max(operands)
+        (depths, depth), max_operand = target_depths[mask]
+        if node in depths:
+            return depths[node]
+        return max(depth+1, min_steps(node, target, max_operand))
+    using_mask = ranks.mask(using)
+    target_length = 0 if pattern_db is None else pattern_db.length(target)
+    require_mask = 0 if require is None else ranks.mask(require)
+    def heuristic(path: ExpressionPath) -> int:
+        # You can treat this as "best case" for finishing a problem
+        # node, (old_operator, old_operand) = path[-1]
+        if not lower_bounds:
+            return path.sources(), len(path), path.set_cmp_key()
+        node = path[-1][0]
+        steps = max(steps_to_target(node, using_mask), target_length-len(path))
+        if require_mask and not path.operand_mask & require_mask:
+            steps = max(steps, 1)
+            return path.sources()+max(1, min_added_sources(path, steps)), len(path)+steps, path.set_cmp_key()
+        added = min_added_sources(path, steps)
+        if added == 0:
+            # Finishing without another source means only using what the
+            # path already has, which can take longer (or not fit at all)
+            own_steps = max(steps_to_target(node, path.operand_mask), target_length-len(path))
+            if min_added_sources(path, own_steps) == 0:
+                steps = own_steps
+            else:
+                added = 1
+        return path.sources()+added, len(path)+steps, path.set_cmp_key()
+    return heuristic
+
+def cheaper_forward(forward_size, forward_growth, backward_size, backward_growth):
+    # Which side of a bidirectional search to grow next, the one whose next
+    # layer should look at fewer paths (how many are in it times how many
+    # each of its pops has looked at so far)
+    # The start has every operand and operator to try while inverting from
+    # the end often goes nowhere, so this usually isn't just alternating
+    # Meetings only ever become the incumbent, so which side goes first
+    # changes how fast the search is and never what it finds
+    if not backward_size:
+        return True
+    if not forward_size:
+        return False
+    return forward_size*forward_growth <= backward_size*backward_growth
+
+def minimal_solution(target: int, using: list, cache=None, stats=None) -> ExpressionPath:
+    # stats (a dict) gets how many nodes got popped, like minimal_set_solution
+    if cache is not None:
+        return cached_solution(cache, minimal_solution, target, using, stats=stats)
     using = set(using)
     if target in using:
+        if stats is not None:
+            stats['popped'] = 0
         return [(target, (None, target))]
-    operator_symbols = {'+', '*', '-', '/', '^'}
+    operator_symbols = OPERATOR_SYMBOLS
     
     counter = 1
-    path_score = functools.cmp_to_key(path_cmp)
     def queue_input(path, cost, counter=0):
         number = path[-1][0]
-        return ((cost, abs(target - number), path_score(path), counter), path)
+        return ((cost, abs(target - number), path_cmp_key(path), counter), path)
 
     def queue_input_back(path, cost, counter=0):
         # TODO: Put a heuristic in here between counter and cost
@@ -438,139 +1441,191 @@ def minimal_solution(target: int, using: list) -> ExpressionPath:
     end_paths = []
     start_dict = dict([(number,[[number, (None, number)]]) for number in using])
 
+    # Nothing's been measured yet, so both start out as every edge
+    forward_growth = backward_growth = len(using)*len(operator_symbols)
+    # Going backwards mostly stays below target, past it NumberIndex still
+    # works, just without the sieve
+    number_index = NumberIndex(using, min(SIEVE_LIMIT, target))
+    popped = 0
+    def finish(found_path):
+        if stats is not None:
+            stats['popped'] = popped
+        return found_path
     # while not done
     while queue or queue_back:
-        # Get area around the start until next length
-        new_queue = []
-        heapq.heapify(new_queue)
-        while queue:
-            score, path = heapq.heappop(queue)
-            cost, _, _, _ = score
-            node, _ = path[-1]
-            if node in visited_back:
-                start_paths.append(path)
-            else:
-                edges = [(operator, operand) for operator in operator_symbols for operand in using]
-                
-                for edge in edges:
-                    operator, operand = edge
-                    neighbor = operate(operator, node, operand)
-                    if neighbor in {node, operand} or neighbor in using:
-                        continue
-                    new_cost = cost+1
-                    if neighbor in visited and visited[neighbor] < new_cost:
-                        continue
-                    new_path = path.copy()
-                    new_path.append((neighbor, edge))
-                    new_input = queue_input(new_path, new_cost, counter)
+        # Grow whichever side looks cheaper to grow by a layer, measured by
+        # how many paths its last layer made per path, see cheaper_forward()
+        # The end never steps back onto an allowed number that's also the
+        # operand (2 for 2+2=4), so the start always goes first to have those
+        if popped == 0 or cheaper_forward(len(queue), forward_growth, len(queue_back), backward_growth):
+            # Get area around the start until next length
+            counted = counter
+            new_queue = []
+            heapq.heapify(new_queue)
+            layer = []
+            # All of it gets popped
+            popped += len(queue)
+            while queue:
+                score, path = heapq.heappop(queue)
+                cost, _, _, _ = score
+                node, _ = path[-1]
+                if node in visited_back:
+                    start_paths.append(path)
+                else:
+                    layer.append((cost, path))
+            if start_paths != []:
+                # Returning below, no point growing the start any further
+                layer = []
+            # The whole layer gets expanded in one go
+            for index, operator, operand, neighbor in zip(*expand_values([path[-1][0] for _, path in layer], using, operator_symbols)):
+                cost, path = layer[index]
+                edge = (operator, operand)
+                if neighbor in using:
+                    continue
+                if len(path) > 1 and redundant_steps(path[-2][0], path[-1][1], edge, neighbor, reorder=True):
+                    continue
+                new_cost = cost+1
+                if neighbor in visited and visited[neighbor] < new_cost:
+                    continue
+                new_path = path.copy()
+                new_path.append((neighbor, edge))
+                new_input = queue_input(new_path, new_cost, counter)
                     
-                    if neighbor not in start_dict:
-                        start_dict[neighbor] = []
-                    start_dict[neighbor].append(new_path)
-                    heapq.heappush(new_queue, new_input)
-                    visited[neighbor] = new_cost
-                    counter += 1
-        queue = new_queue
-        # If found, stop, mark
-        if start_paths != []:
-            # Do the return here
-            found_path = None
-            best_score = None
-            for start_path in start_paths:
-                middle = start_path[-1][0]
-                assert middle in end_dict
-                # print(middle)
-                # print(end_dict[middle])
-                for reversed_end_path in end_dict[middle]:
-                    end_path = list(reversed(reversed_end_path))
-                    total_path = start_path+end_path[1:]
-                    current_score = path_score(total_path)
-                    if best_score is None or best_score > current_score:
-                        found_path = total_path
-                        best_score = current_score
-            # print("Bing")
-            return ExpressionPath(found_path)
-        # end_dict = dict()
-        # Get area around the end until next length
-        new_queue_back = []
-        heapq.heapify(new_queue_back)
-        while queue_back:
-            score, path = heapq.heappop(queue_back)
-            cost, _ = score
-            node, _ = path[-1]
-            if node == MAX_INT:
-                print("MAX_INT Reached!")
-            if node in visited:
-                end_paths.append(path)
-            else:
-                edges = [(operator, operand) for operator in operator_symbols for operand in using]
-                
-                for edge in edges:
-                    operator, operand = edge
-                    neighbor = invert(operator, operand, node)
-                    if neighbor in {node, operand}:
-                        continue
-                    new_cost = cost+1
-                    if neighbor in visited_back and visited_back[neighbor] < new_cost:
-                        continue
-                    new_path = path.copy()
-                    # This is gonna be weird
-                    new_path[-1] = (node, edge)
-                    new_path.append((neighbor, None))
-                    new_input = queue_input_back(new_path, new_cost, counter)
+                if neighbor not in start_dict:
+                    start_dict[neighbor] = []
+                start_dict[neighbor].append(new_path)
+                heapq.heappush(new_queue, new_input)
+                visited[neighbor] = new_cost
+                counter += 1
+            queue = new_queue
+            forward_growth = (counter-counted)/len(layer) if layer else 0
+            # If found, stop, mark
+            if start_paths != []:
+                # Do the return here
+                for start_path in start_paths:
+                    assert start_path[-1][0] in end_dict
+                # print("Bing")
+                return finish(best_list_join(([start_path], end_dict[start_path[-1][0]]) for start_path in start_paths))
+        else:
+            # end_dict = dict()
+            # Get area around the end until next length
+            counted = counter
+            new_queue_back = []
+            heapq.heapify(new_queue_back)
+            layer = []
+            popped += len(queue_back)
+            while queue_back:
+                score, path = heapq.heappop(queue_back)
+                cost, _ = score
+                node, _ = path[-1]
+                if node in visited:
+                    end_paths.append(path)
+                else:
+                    layer.append((cost, path))
+            if end_paths != []:
+                layer = []
+            for index, operator, operand, neighbor in zip(*expand_values([path[-1][0] for _, path in layer], number_index.operands, operator_symbols, True, number_index)):
+                cost, path = layer[index]
+                node, _ = path[-1]
+                edge = (operator, operand)
+                if len(path) > 1 and redundant_steps(neighbor, edge, path[-2][1], path[-2][0]):
+                    continue
+                new_cost = cost+1
+                if neighbor in visited_back and visited_back[neighbor] < new_cost:
+                    continue
+                new_path = path.copy()
+                # This is gonna be weird
+                new_path[-1] = (node, edge)
+                new_path.append((neighbor, None))
+                new_input = queue_input_back(new_path, new_cost, counter)
                     
-                    if neighbor not in end_dict:
-                        end_dict[neighbor] = []
-                    end_dict[neighbor].append(new_path)
-                    heapq.heappush(new_queue_back, new_input)
-                    visited_back[neighbor] = new_cost
-                    counter += 1
-        queue_back = new_queue_back
-        # If found, stop, mark
-        if end_paths != []:
-            # Do the return here
-            found_path = None
-            best_score = None
-            # print(start_dict)
-            for reversed_end_path in end_paths:
-                end_path = list(reversed(reversed_end_path))
-                # print(end_path)
-                middle = end_path[0][0]
-                # print(f"Middle: {middle}")
-                assert middle in start_dict
-                for start_path in start_dict[middle]:
-                    total_path = start_path+end_path[1:]
-                    # print(str(total_path))
-                    current_score = path_score(total_path)
-                    if best_score is None or best_score > current_score:
-                        found_path = total_path
-                        best_score = current_score
-            # print(best_score)
-            # print("Bong")
-            return ExpressionPath(found_path)
+                if neighbor not in end_dict:
+                    end_dict[neighbor] = []
+                end_dict[neighbor].append(new_path)
+                heapq.heappush(new_queue_back, new_input)
+                visited_back[neighbor] = new_cost
+                counter += 1
+            queue_back = new_queue_back
+            backward_growth = (counter-counted)/len(layer) if layer else 0
+            # If found, stop, mark
+            if end_paths != []:
+                # Do the return here
+                for reversed_end_path in end_paths:
+                    assert reversed_end_path[-1][0] in start_dict
+                # print("Bong")
+                return finish(best_list_join((start_dict[reversed_end_path[-1][0]], [reversed_end_path]) for reversed_end_path in end_paths))
         # start_dict = dict()
-    print(f"NO PATH TO {target} FOUND")
-    return None
+    return finish(None)
 
-def minimal_set_solution(target, using, belts_per_source):
-    print(f"Finding {target}")
+def minimal_set_solution(target, using, belts_per_source, cache=None, lower_bounds=True, branch_and_bound=True, stats=None, memory_limit=None, pattern_db=None, seed=None, require=None, processes=None):
+    # processes spreads the search over that many processes instead, see
+    # sharded_set_solution
+    if cache is not None:
+        return cached_solution(cache, minimal_set_solution, target, using, belts_per_source, lower_bounds=lower_bounds, branch_and_bound=branch_and_bound,
+                               stats=stats, memory_limit=memory_limit, pattern_db=pattern_db, seed=seed, require=require, processes=processes)
+    if processes is not None:
+        assert memory_limit is None and pattern_db is None and require is None, "sharded_set_solution can't spill, use pattern_db or require numbers"
+        return sharded_set_solution(target, using, belts_per_source, processes, lower_bounds, branch_and_bound, stats, seed)
+    search = set_solution_search(target, using, belts_per_source, lower_bounds, branch_and_bound, stats, seed, memory_limit, pattern_db, require)
+    while True:
+        try:
+            next(search)
+        except StopIteration as stop:
+            return stop.value
+
+def set_solution_search(target, using, belts_per_source, lower_bounds=True, branch_and_bound=True, stats=None, seed=None, memory_limit=None, pattern_db=None, require=None):
+    # The search behind minimal_set_solution, as a generator that yields
+    # (incumbent, lower_bound) before every pop and returns the answer
+    # incumbent is the best ExpressionJoined so far (or None), lower_bound
+    # the (sources, length) nothing left to find can beat
+    # seed is any path to target to start the incumbent off with
+    # stats (a dict) gets filled in with what the search did once it's done,
+    # see search_stats(), nothing gets counted per layer without it
+    # With memory_limit (KiB of resident memory) layers that aren't up yet
+    # go to disk once memory_in_use() gets near it, see FrontierSpill
+    # pattern_db is a PatternDatabase for the same allowed numbers, for
+    # tighter lower bounds (only with lower_bounds)
+    # require is for when seed is already the best path that doesn't use any
+    # of those numbers, so anything that hasn't used one yet still needs
+    # another source (only with lower_bounds)
     sorted_using = sorted(using)
     min_using = sorted_using[0]
     assert min_using >= 1
     max_using = sorted_using[-1]
     using = set(using)
+    # Every path here shares one, see OperandRanks
+    ranks = operand_ranks(using)
     # if target in using:
     #     return [(target, (None, target))]
-    operator_symbols = ['+', '*', '-', '/', '^']
-    # Consistent and admissable
-    # Consistent -> h(n) <= c(n,a,n')+h(n')
-    # Admissable -> h(n) <= h*(n)
-    # Consistent -> Admissable
-    def heuristic(path: ExpressionPath) -> int:
-        # You can treat this as "best case" for finishing a problem
-        # node, (old_operator, old_operand) = path[-1]
-        return path.sources(), len(path), path_score(path)
-        # return path.sources()+minimum_sources_from_target, len(path), path.max_operand(), path_score(path)# , abs(target-node)
+    operator_symbols = OPERATOR_SYMBOLS
+    # Nothing makes target in fewer operands than pattern_db says, and no
+    # start path to a value is shorter than it says either
+    assert pattern_db is None or pattern_db.matches(using)
+    require_mask = 0 if require is None else ranks.mask(require)
+    heuristic = forward_heuristic(target, using, ranks, lower_bounds, pattern_db, require)
+    started = time.perf_counter()
+    start_depths, start_depth = step_depths(using, using) if lower_bounds else ({}, -1)
+    # The steps back to a start only depend on the value, and the back looks
+    # at the same values over and over
+    back_steps = {}
+    def heuristic_back(path: ExpressionEnd) -> int:
+        # Same from the other side, it still needs a number to start from
+        if not lower_bounds:
+            return path.sources(), len(path), path.set_cmp_key()
+        node = path.first_number
+        if node not in back_steps:
+            if node in start_depths:
+                steps = 1+start_depths[node]
+            else:
+                steps = 1+max(start_depth+1, min(min_steps(number, node, max_using) for number in using))
+            if pattern_db is not None:
+                steps = max(steps, pattern_db.length(node))
+            back_steps[node] = steps
+        steps = back_steps[node]
+        added = min_added_sources(path, steps)
+        if require_mask and not path.operand_mask & require_mask:
+            added = max(added, 1)
+        return path.sources()+added, len(path)+steps, path.set_cmp_key()
     # The cost can be sources
     # h*(n) is the amount of sources it would actually take to get to n
     # h(n) <= the true amount of sources required, so undershoot (lower bound)
@@ -580,204 +1635,213 @@ def minimal_set_solution(target, using, belts_per_source):
     # If 1, h(n) < h(n') since h(n')=h(n)+1
      
     # counter = 1
-    path_score = functools.cmp_to_key(path_set_cmp)
     def queue_input(path: ExpressionPath): # , counter=0):
         # number = path[-1][0]
         return (heuristic(path), path)
     def queue_input_back(path: ExpressionEnd):
-        return (heuristic(path), path)
-    def visit_cost(path: ExpressionPath):
-        return path.sources()
+        return (heuristic_back(path), path)
 
-    queue = [queue_input(ExpressionPath([(number, (None, number))], belts_per_source)) for number in using]
+    queue = [queue_input(ExpressionPath([(number, (None, number))], belts_per_source, ranks)) for number in using]
     heapq.heapify(queue)
 
-    queue_back = [queue_input_back(ExpressionEnd([], belts_per_source, target))]
+    queue_back = [queue_input_back(ExpressionEnd([], belts_per_source, target, ranks))]
     heapq.heapify(queue_back)
     # print(queue)
 
     # visited = defaultdict(lambda: float('inf'), dict([((number, frozenset([number])), 1) for number in using]))
     # visited_back = defaultdict(lambda: float('inf'), dict([((target, frozenset()), 0)]))
     # visited = defaultdict(lambda: float('inf'), dict([((number, frozenset({number})), 1) for number in using]))
-    visited = defaultdict(lambda: float('inf'))
-    print(visited)
-    visited_back = defaultdict(lambda: float('inf'), dict([((number, frozenset({})), 0) for number in {target}]))
+    visited = MeetingPaths()
+    visited_back = MeetingPaths()
 
-    start_paths = []
-    start_sets = defaultdict(lambda: set())
-    end_dict = defaultdict(lambda: list(), {target: [ExpressionEnd([], belts_per_source, target)]})
+    end_dict = MeetingPaths()
+    end_dict.add(target, ExpressionEnd([], belts_per_source, target, ranks))
 
-    end_paths = []
-    end_sets = defaultdict(lambda: set())
-    start_dict = defaultdict(lambda: list(), dict([(number,[ExpressionPath([(number, (None, number))], belts_per_source)]) for number in using]))
-    edges = [(operator, operand) for operator in operator_symbols for operand in using]
+    start_dict = MeetingPaths()
+    for number in using:
+        start_dict.add(number, ExpressionPath([(number, (None, number))], belts_per_source, ranks))
+    spill = None if memory_limit is None else FrontierSpill(belts_per_source, ranks)
+    forward_neighbors = NeighborTable(using, operator_symbols)
+    backward_neighbors = NeighborTable(using, operator_symbols, backward=True)
+
+    # Branch and bound: the best full path seen so far (an ExpressionJoined),
+    # anything that can't finish at least as well as it never gets queued
+    # make_worst_path() always works when 1 is allowed, so it's the first one
+    incumbent = None
+    if branch_and_bound and min_using == 1 and target not in using:
+        worst_path = make_worst_path(target, sorted_using, belts_per_source, max_length=1<<10)
+        if worst_path is not None and all(operator in operator_symbols for operator in worst_path.operator_list()):
+            incumbent = ExpressionJoined(worst_path, ExpressionEnd([], belts_per_source, target))
+    if branch_and_bound and seed is not None:
+        seed = ExpressionJoined(seed, ExpressionEnd([], belts_per_source, target))
+        if incumbent is None or seed.better_than(incumbent):
+            incumbent = seed
+    counts = {direction: dict.fromkeys(SEARCH_COUNTERS, 0) for direction in ['forward', 'backward']}
+    forward_counts = counts['forward']
+    backward_counts = counts['backward']
+    # Per layer stats are a snapshot of counts when the layer starts and the
+    # difference when it ends, so the loops themselves don't do anything extra
+    layers = []
+    open_layer = None
+    def start_layer(direction, layer, frontier):
+        nonlocal open_layer
+        end_layer()
+        if stats is not None:
+            open_layer = (direction, layer, frontier, dict(counts[direction]), time.perf_counter())
+    def end_layer():
+        nonlocal open_layer
+        if open_layer is not None:
+            direction, layer, frontier, before, layer_started = open_layer
+            entry = {'direction': direction, 'layer': list(layer), 'frontier': frontier,
+                     'seconds': time.perf_counter()-layer_started}
+            entry.update((key, count-before[key]) for key, count in counts[direction].items())
+            layers.append(entry)
+            open_layer = None
+    def pop_work(direction_counts):
+        # Paths looked at per pop, pushed or not, since a side that throws
+        # most of them away still pays for making and checking them
+        looked_at = sum(direction_counts[key] for key in ['pushed', 'dominated', 'pruned', 'redundant'])
+        return looked_at/direction_counts['popped']
+    def layer_size(side):
+        # Only the next layer gets popped, the rest of the queue can wait
+        return sum(score[:2] == side[0][0][:2] for score, _ in side) if side else 0
+    def beaten(score):
+        # True if nothing with this lower bound can beat the incumbent
+        return incumbent is not None and score[:2] > incumbent.score_key()[:2]
+    def finish(found_path):
+        if stats is not None:
+            end_layer()
+            stats.update(search_stats(counts, layers, started, setup_seconds, [visited, visited_back]))
+            stats['incumbent'] = None if incumbent is None else str(incumbent)
+        return found_path
+    setup_seconds = time.perf_counter()-started
+    # Every path is reached from the start, so the start's layer bounds them
+    lower_bound = (0, 0)
     # while not done
-    while queue or queue_back:
+    while queue or queue_back or spill:
+        if not queue_back:
+            # Only the back looks anything up in start_dict, and once it's
+            # done it's a copy of every path the queue already has
+            start_dict = None
+        # Only one side grows a layer per round, whichever looks cheaper
+        # going by its size and how many paths each pop has looked at so far
+        # (see cheaper_forward), but the start always goes first like in
+        # minimal_solution
+        expand_forward = forward_counts['popped'] == 0 or cheaper_forward(
+            layer_size(queue)+(len(spill) if spill is not None and not queue else 0), pop_work(forward_counts),
+            layer_size(queue_back), pop_work(backward_counts) if backward_counts['popped'] else len(using)*len(operator_symbols))
         # Get area around the start until next length
-        print(f"len(queue)={len(queue)}")
-        layer = visit_cost(queue[0][1])
-        print(f"layer = {layer}")
-        while queue and visit_cost(queue[0][1]) == layer:
-            _, path = heapq.heappop(queue)
+        # Layers go by the least sources (then length) a path could finish
+        # with, so neither side runs off on its own while the other waits
+        layer = queue[0][0][:2] if queue and expand_forward else None
+        if spill is not None and expand_forward:
+            layer = spill.restore(queue, layer, queue_input)
+        if layer is not None:
+            start_layer('forward', layer, len(queue))
+            forward_neighbors.expect(path[-1][0] for score, path in queue if score[:2] == layer)
+        while queue and queue[0][0][:2] == layer:
+            lower_bound = layer
+            yield incumbent, lower_bound
+            score, path = heapq.heappop(queue)
             node, _ = path[-1]
-            print(f"Here's the node from the start: {node}")
+            forward_counts['popped'] += 1
+            if spill is not None and forward_counts['popped'] % SPILL_CHECK_POPS == 0 and memory_in_use() >= memory_limit*0.9:
+                spill.spill(queue, layer)
+            if beaten(score):
+                # Everything left is at least this bad
+                return finish(incumbent.to_path())
             
-            worse = False
-            for used_operands in all_subsets(path.operand_set()):
-                used_operands = frozenset(used_operands)
-                # bool([for for operand,occurence in path.operand_occurences().items()])
-                if visited[(node, used_operands)] <= visit_cost(path):# or used_operands in start_sets:
-                    worse = True
-                    break
-            if worse:
+            if not visited.add(node, path):
+                forward_counts['dominated'] += 1
                 continue
-            visited[(node, frozenset(path.operand_set()))] = visit_cost(path)
-            # print("It wasn't skipped")
-            print(f"Here's the path for it: {str(path)}")
-            found_condition = False
-            for used_operands in all_subsets(path.operand_set()):
-                if (node, frozenset(used_operands)) in visited_back:
-                    print("Found a connection")
-                    found_condition = True
-                    break
-            if found_condition:
-                print(f"Got one, adding it: {path}")
-                start_paths.append(path)
-                # start_sets[frozenset(path.operand_list())].add(frozenset(path.operand_occurences().items()))
-                break
-            else:
-                for edge in edges:
-                    operator, operand = edge
-                    neighbor = operate(operator, node, operand)
-                    if neighbor in {node, operand} or neighbor <= 0:
-                        continue
+            # Anything the back has generated can be joined onto, but the
+            # first meeting isn't always the best one, so it only becomes the
+            # incumbent and the search goes on until beaten() says it's done
+            if node in end_dict:
+                better = best_join([([path], end_dict[node])], incumbent)
+                if better is not incumbent:
+                    incumbent = better
+                    forward_counts['incumbents'] += 1
+            if node != target:
+                before, last_edge = forward_context(path)
+                for edge, neighbor in forward_neighbors[node]:
                     # new_visit_cost = cost+1
+                    if redundant_steps(before, last_edge, edge, neighbor):
+                        forward_counts['redundant'] += 1
+                        continue
                     
                     new_path = path.appended((neighbor, edge))
-                    new_visit_cost = visit_cost(new_path)
-                    worse = False
-                    for used_operands in all_subsets(new_path.operand_set()):
-                        used_operands = frozenset(used_operands)
-                        if visited[(neighbor, used_operands)] < new_visit_cost:# or used_operands in start_sets:
-                            worse = True
-                            break
-                        # or (start_paths == [] and best_visit_cost == new_visit_cost)
-                    if worse:
+                    if visited.beaten(neighbor, new_path):
+                        forward_counts['dominated'] += 1
                         continue
                     # if I already started filling start_paths
                     # and if I can make the 
                     new_input = queue_input(new_path)
+                    if beaten(new_input[0]):
+                        forward_counts['pruned'] += 1
+                        continue
+                    if branch_and_bound and neighbor in end_dict:
+                        better = best_join([([new_path], end_dict[neighbor])], incumbent)
+                        if better is not incumbent:
+                            incumbent = better
+                            forward_counts['incumbents'] += 1
                     
-                    start_dict[neighbor].append(new_path)
+                    if start_dict is not None:
+                        start_dict.add(neighbor, new_path)
                     heapq.heappush(queue, new_input)
+                    forward_counts['pushed'] += 1
                     
-        # If found, stop, mark
-        if start_paths != []: # and end_paths != []:
-            # Do the return here
-            found_path = None
-            best_score = None
-            for start_path in start_paths:
-                middle = start_path[-1][0]
-                assert middle in end_dict
-                # print(middle)
-                # print(end_dict[middle])
-                for end_path in end_dict[middle]:
-                    assert isinstance(end_path, ExpressionEnd)
-                    assert end_path.first_number == middle
-                    total_path = ExpressionJoined(start_path, end_path).to_path()
-                    current_score = path_score(total_path)
-                    if best_score is None or best_score > current_score:
-                        found_path = total_path
-                        best_score = current_score
-            # print("Bing")
-            return found_path
-        assert target not in using
-        print(f"len(queue_back)={len(queue_back)}")
-        layer = visit_cost(queue_back[0][1])
-        print(f"layer = {layer}")
-        while queue_back and visit_cost(queue_back[0][1]) == layer:
-            _, path = heapq.heappop(queue_back)
+        # The back can run dry before the start does
+        layer = queue_back[0][0][:2] if queue_back and not expand_forward else None
+        if layer is not None:
+            start_layer('backward', layer, len(queue_back))
+            backward_neighbors.expect(path.first_number for score, path in queue_back if score[:2] == layer)
+        while queue_back and queue_back[0][0][:2] == layer:
+            yield incumbent, lower_bound
+            score, path = heapq.heappop(queue_back)
             node = path.first_number
-            print(f"Here's the node from the back: {node}")
-            print(f"Here's the path for it: {str(path)}")
-            if node == MAX_INT:
-                print("MAX_INT Reached!")
-            worse = False
-            print(f"Full operand set: {path.operand_set()}")
-            for used_operands in all_subsets(path.operand_set()):
-                used_operands = frozenset(used_operands)
-                if visited_back[(node, used_operands)] <= visit_cost(path) or used_operands in end_sets:
-                    print(f"It looks like we can get {node} using {used_operands} in {visited_back[(node, frozenset(used_operands))]} layers, so skip")
-                    worse = True
-                    break
-            if worse:
+            backward_counts['popped'] += 1
+            if beaten(score):
+                return finish(incumbent.to_path())
+            if not visited_back.add(node, path):
+                # We can get node using fewer of its operands already
+                backward_counts['dominated'] += 1
                 continue
-            print(f"It's actually better than any found method")
-            visited_back[(node, frozenset(path.operand_set()))] = visit_cost(path)
-            found_condition = False
-            for used_operands in all_subsets(path.operand_set()):
-                print(f"Have I visited {node} using {used_operands}?")
-                if (node, frozenset(used_operands)) in visited:
-                    print(f"We can get to {node} from the front only using {used_operands}, so we can send it")
-                    found_condition = True
-                    break
-            if found_condition:
-                end_paths.append(path)
-                # end_sets[frozenset(path.operand_list())].add(frozenset(path.operand_occurences().items()))
-                break
-            else:
-                print(f"We never found ({node}, {frozenset(used_operands)}) in there, look: {visited[(node, frozenset(used_operands))]}")
-                # WHAT??? Why would we need to do that???? Don't be dumb. 
-                # Visualize. Here's the back:           <-
-                # We need to check the start_dict to see if there's a connection
-                # The problem is, there isn't a null connection 
-                # Forgot the check null operands
+            if node in start_dict:
+                # We can get to node from the front, same as above
+                better = best_join([(start_dict[node], [path])], incumbent)
+                if better is not incumbent:
+                    incumbent = better
+                    backward_counts['incumbents'] += 1
+            # WHAT??? Why would we need to do that???? Don't be dumb. 
+            # Visualize. Here's the back:           <-
+            # We need to check the start_dict to see if there's a connection
+            # The problem is, there isn't a null connection 
+            # Forgot the check null operands
+            
+            context = backward_context(path)
+            for edge, neighbor in backward_neighbors[node]:
+                # new_cost = cost+1
+                if context is not None and redundant_steps(neighbor, edge, *context):
+                    backward_counts['redundant'] += 1
+                    continue
+                new_path = path.appended((path.first_number, edge), neighbor)
+                if visited_back.beaten(neighbor, new_path):
+                    backward_counts['dominated'] += 1
+                    continue
+                new_input = queue_input_back(new_path)
+                if beaten(new_input[0]):
+                    backward_counts['pruned'] += 1
+                    continue
+                if branch_and_bound and neighbor in start_dict:
+                    better = best_join([(start_dict[neighbor], [new_path])], incumbent)
+                    if better is not incumbent:
+                        incumbent = better
+                        backward_counts['incumbents'] += 1
                 
-                for edge in edges:
-                    operator, operand = edge
-                    neighbor = invert(operator, operand, node)
-                    if node in {neighbor, operand} or neighbor <= 0:
-                        continue
-                    # new_cost = cost+1
-                    new_path = path.appended((path.first_number, edge), neighbor)
-                    new_visit_cost = visit_cost(new_path)
-                    worse = False
-                    for used_operands in all_subsets(new_path.operand_set()):
-                        used_operands = frozenset(used_operands)
-                        if visited_back[(neighbor, used_operands)] < new_visit_cost or used_operands in end_sets:
-                            worse = True
-                            break
-                    if worse:
-                        continue
-                    new_input = queue_input_back(new_path)
-                    
-                    end_dict[neighbor].append(new_path)
-                    heapq.heappush(queue_back, new_input)
-        # If found, stop, mark
-        if end_paths != []: # and start_paths != []:
-            # Do the return here
-            found_path = None
-            best_score = None
-            # print(start_dict)
-            for end_path in end_paths:
-                # print(end_path)
-                assert isinstance(end_path, ExpressionEnd)
-                middle = end_path.first_number
-                # print(f"Middle: {middle}")
-                assert middle in start_dict
-                for start_path in start_dict[middle]:
-                    total_path = ExpressionJoined(start_path, end_path).to_path()
-                    # print(str(total_path))
-                    current_score = path_score(total_path)
-                    if best_score is None or best_score > current_score:
-                        found_path = total_path
-                        best_score = current_score
-            # print(best_score)
-            # print("Bong")
-            return found_path
-        assert end_paths == []
-        
-        
+                end_dict.add(neighbor, new_path)
+                heapq.heappush(queue_back, new_input)
+                backward_counts['pushed'] += 1
         # end_dict = dict()
         # Get area around the end until next length
         # print(queue_back)
@@ -788,104 +1852,527 @@ def minimal_set_solution(target, using, belts_per_source):
         # assert isinstance(queue_back[0][1], ExpressionEnd)
         
         # start_dict = dict()
-    print(f"NO PATH TO {target} FOUND")
-    return None
-    # queue = [queue_input(ExpressionPath([(number, (None, number))], belts_per_source=belts_per_source)) for number in using]
-    # heapq.heapify(queue)
-    # # print(queue)
-
-    # visited = defaultdict(lambda: float('inf'))
-    # worst_path = make_worst_path(target, sorted_using, belts_per_source)
-    # worst_score = path_score(worst_path)
-    # edges = [(operator, operand) for operator in operator_symbols for operand in using]
-    # while queue:
-    #     _, path = heapq.heappop(queue)
-    #     node, (old_operator, old_operand) = path[-1]
-    #     worse = False
-    #     for used_operands in non_empty_subsets(path.operand_set()):
-    #         if visited[(node, frozenset(used_operands))] <= path.sources():
-    #             worse = True
-    #             break
-        
-    #     if worse:
-    #         continue
-    #     visited[(node, frozenset(path.operand_set()))] = path.sources()
-    #     print(f"{str(path)}={node}")
-    #     # if old_operator == '/' and old_operand == 7 and node == 5: print(f"{str(path)}={node}")
-    #     if node == target:
-    #         # print(str(path, operator_dict))
-    #         return path
-    #     else:
-    #         # edges_# t0 = time.time()
-    #         for edge in edges:
-    #             # t0 = time.time()
-    #             operator, operand = edge
-    #             neighbor = operate(operator, node, operand)
-                
-    #             # t1 = time.time()
-    #             # # if round(t1-t0,3)>=0.03: print(f"Step B took {round(t1-t0, 3)}s")
-
-    #             # t0 = time.time()
-    #             if neighbor in {node, operand}:
-    #                 continue
-    #             if '-' in operator_symbols and \
-    #                 (old_operand==operand and (old_operator, operator) in {('+', '-'), ('-', '+')}):
-    #                 continue
-    #             if '/' in operator_symbols and \
-    #                 (old_operand==operand and (old_operator, operator) in {('*', '/'), ('/', '*')}):
-    #                 continue
-    #             # t1 = time.time()
-    #             # # if round(t1-t0,3)>=0.03: print(f"Step C took {round(t1-t0, 3)}s")
-    #             # t0 = time.time()
-    #             new_length = len(path)+1
-    #             if '/' in operator_symbols and new_length>neighbor+1 and operand*node<=MAX_INT :
-    #                 # Making x is as easy as (n*x)/n=(n+n+n+..+n_x)/n, even with small belts_per_source
-    #                 # There are x n's divided by 1 n, giving x+1 operands
-    #                 continue
-    #             if '^' in operator_symbols and neighbor == MAX_INT and new_length>=math.ceil(math.log(max_using, MAX_INT)):
-    #                 continue
-    #             new_path = path.appended((neighbor, edge))
-    #             new_cost = path_score(new_path)
-    #             if new_cost > worst_score:
-    #                 continue
-    #             new_visit_cost =  new_path.sources()
-    #             # new_visit_cost = new_length                
-    #             worse = False
-    #             for used_operands in non_empty_subsets(new_path.operand_set()):
-    #                 if visited[(neighbor, frozenset(used_operands))] < new_visit_cost:
-    #                     worse = True
-    #                     break
-                
-    #             if worse:
-    #                 continue
-    #             new_input = queue_input(new_path) #, counter)
-    #             heapq.heappush(queue, new_input)
-    #             # t1 = time.time()
-    #             # if round(t1-t0,3)>=0.1: print(f"Step H took {round(t1-t0, 3)}s")
-    #             # visited[neighbor] = new_visit_cost
-    #             # visited[(neighbor, frozenset(new_path.operand_set()))] = new_visit_cost
-                
-    #             # counter += 1
-                
-    #         # edges_# t1 = time.time()
-    #         # assert edges_t1-edges_t0 < 0.3
-    # print(f"NO PATH TO {target} FOUND")
-    # # This should be impossible in all cases where 1 exists
-    # return worst_path
-
-def non_empty_subsets(input_set):
-    subsets = []
-    for i in range(1, len(input_set) + 1):
-        subsets.extend(itertools.combinations(input_set, i))
-    return [set(subset) for subset in subsets]
-
-def all_subsets(input_set):
-    subsets = []
-    for i in range(len(input_set) + 1):
-        subsets.extend(itertools.combinations(input_set, i))
-    return [set(subset) for subset in subsets]
-
-def make_worst_path(target, sorted_list, belts_per_source):
+    if incumbent is not None:
+        return finish(incumbent.to_path())
+    return finish(None)
+
+SEARCH_COUNTERS = ['popped', 'pushed', 'dominated', 'pruned', 'redundant', 'incumbents']
+
+def search_stats(counts, layers, started, setup_seconds, indexes):
+    # What set_solution_search puts in its stats dict, all of it plain
+    # JSON (see stats_json) so it can go straight to a file
+    # Totals are at the top, then the same counters per direction, then
+    # one entry per layer with the frontier size when it started
+    stats = {key: sum(direction[key] for direction in counts.values()) for key in SEARCH_COUNTERS}
+    stats['directions'] = {direction: dict(direction_counts) for direction, direction_counts in counts.items()}
+    stats['layers'] = layers
+    stats['peak_frontier'] = {direction: max((entry['frontier'] for entry in layers if entry['direction'] == direction), default=0)
+                              for direction in counts}
+    stats['visited'] = [len(index) for index in indexes]
+    stats['seconds'] = {'setup': setup_seconds, 'total': time.perf_counter()-started}
+    for direction in counts:
+        stats['seconds'][direction] = sum(entry['seconds'] for entry in layers if entry['direction'] == direction)
+    # Peak for the whole process, in KiB (bytes on macOS)
+    stats['peak_memory'] = None if resource is None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return stats
+
+def stats_json(stats, file=None):
+    # stats from minimal_set_solution as JSON, written to file if given
+    text = json.dumps(stats, indent=1)
+    if file is not None:
+        with atomic_write(file, 'w') as f:
+            f.write(text)
+    return text
+
+class AnytimeSearch:
+    # minimal_set_solution on a budget, for when proving the best answer
+    # would take ages
+    # run() stops after seconds or pops and returns (path, lower_bound, gap):
+    # the best path so far (None if there isn't one yet), the fewest sources
+    # anything could still need, and how many sources path could be off by
+    # Calling run() again carries on where it stopped, once done is True the
+    # path is proven and gap is 0
+    # The first run() with a time budget and nothing found yet spends up to
+    # half of it on minimal_solution (fewest operations is usually quick to
+    # find, and a decent first guess) so there's something to show early
+    # That only gets tried once, if it runs out of time the search gets every
+    # later budget, and pops is how many it's done so far
+    def __init__(self, target, using, belts_per_source, lower_bounds=True, stats=None, pattern_db=None):
+        self.target = target
+        self.using = list(using)
+        self.belts_per_source = belts_per_source
+        self.lower_bounds = lower_bounds
+        self.stats = stats
+        self.pattern_db = pattern_db
+        self.search = None
+        self.incumbent = None
+        self.seeded = None
+        self.seed_tried = False
+        self.pops = 0
+        self.lower_bound = 0
+        self.path = None
+        self.done = False
+
+    def seed(self, seconds):
+        # Only Unix has interval timers, without one there's no seed
+        if not hasattr(signal, 'setitimer') or threading.current_thread() is not threading.main_thread():
+            return None
+        previous = signal.signal(signal.SIGALRM, raise_solve_timeout)
+        signal.setitimer(signal.ITIMER_REAL, seconds)
+        try:
+            try:
+                path = minimal_solution(self.target, self.using)
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous)
+        except SolveTimeout:
+            return None
+        if path is None:
+            return None
+        return parse_expression(str(path), self.belts_per_source)
+
+    def run(self, seconds=None, pops=None):
+        deadline = None if seconds is None else time.time()+seconds
+        if seconds is not None and self.incumbent is None and not self.seed_tried:
+            self.seed_tried = True
+            self.seeded = self.seed(seconds/2)
+        if self.search is None:
+            self.search = set_solution_search(self.target, self.using, self.belts_per_source, self.lower_bounds, True, self.stats, self.seeded, pattern_db=self.pattern_db)
+        count = 0
+        while not self.done:
+            if pops is not None and count >= pops:
+                break
+            # Checking the clock every pop costs more than the pops do
+            if deadline is not None and count % 64 == 0 and time.time() >= deadline:
+                break
+            try:
+                self.incumbent, (self.lower_bound, _) = next(self.search)
+            except StopIteration as stop:
+                self.done = True
+                self.path = stop.value
+                if self.path is not None:
+                    self.lower_bound = self.path.sources()
+                break
+            count += 1
+        self.pops += count
+        return self.report()
+
+    def report(self):
+        if not self.done:
+            # A seed found after the search started isn't its incumbent
+            best = [ExpressionJoined(path, ExpressionEnd([], self.belts_per_source, self.target)) for path in [self.seeded] if path is not None]
+            if self.incumbent is not None:
+                best.append(self.incumbent)
+            if best:
+                self.path = functools.reduce(lambda a, b: b if b.better_than(a) else a, best).to_path()
+        return self.path, self.lower_bound, self.gap()
+
+    def gap(self):
+        if self.path is None:
+            return None
+        return max(0, self.path.sources()-self.lower_bound)
+
+def set_cost_table(limit, using, belts_per_source, max_sources=None, targets=None):
+    # Solves every target in 1..limit (or just targets) with one
+    # shared_set_solutions() sweep instead of a separate minimal_set_solution
+    # per target, keeping the paths in an ExpressionStore
+    # Returns {target: (sources, path)} (a CostTable), missing targets
+    # weren't reachable within max_sources
+    store = ExpressionStore(belts_per_source)
+    table = dict()
+    for target, path in shared_set_solutions(range(1, limit+1) if targets is None else targets, using, belts_per_source, max_sources):
+        if path is not None:
+            table[target] = store.add(path)
+    return CostTable(store, table)
+
+def shared_set_solutions(targets, using, belts_per_source, max_sources=None):
+    # minimal_set_solution for many targets at once
+    # One A* search from the allowed numbers towards whichever target is
+    # nearest, so nothing gets regenerated per target: every path it makes is
+    # one any of the targets could have needed
+    # The lower bound is the fewest steps to any target still left (exact
+    # near them, see step_depths(), min_steps() past that), which is never
+    # more than the steps to the one a path actually ends up at, so each
+    # target's first path popped is its best by path_set_cmp, the same one
+    # minimal_set_solution gives
+    # A path only gets dropped for one popped at its value that beats it
+    # (MeetingPaths.beats), so the first time a value gets popped it can't be
+    # beaten anymore
+    # Anything whose lower bound needs more than max_sources is dropped too
+    # Yields (target, path) as soon as a target's path gets popped, and
+    # (target, None) for whatever's left if everything runs out first
+    using = set(using)
+    remaining = set(targets)
+    if not remaining:
+        return
+    max_using = max(using)
+    smallest, biggest = min(remaining), max(remaining)
+    depths, depth = step_depths(sorted(remaining), using, backward=True)
+    value_steps = dict()
+    def steps(value):
+        if value not in value_steps:
+            if value in depths:
+                value_steps[value] = depths[value]
+            elif value > biggest:
+                value_steps[value] = max(depth+1, min_steps(value, biggest, max_using))
+            elif value < smallest:
+                value_steps[value] = max(depth+1, min_steps(value, smallest, max_using))
+            else:
+                value_steps[value] = depth+1
+        return value_steps[value]
+    def queue_input(path: ExpressionPath):
+        path_steps = steps(path[-1][0])
+        return ((path.sources()+min_added_sources(path, path_steps), len(path)+path_steps, path.set_cmp_key()), path)
+
+    ranks = operand_ranks(using)
+    queue = [queue_input(ExpressionPath([(number, (None, number))], belts_per_source, ranks)) for number in using]
+    heapq.heapify(queue)
+    visited = MeetingPaths()
+    neighbors = NeighborTable(using, OPERATOR_SYMBOLS)
+    layer = None
+    while queue and remaining:
+        score, path = heapq.heappop(queue)
+        node, _ = path[-1]
+        if max_sources is not None and score[0] > max_sources:
+            break
+        if score[:2] != layer:
+            layer = score[:2]
+            neighbors.expect([node]+[queued[-1][0] for queued_score, queued in queue if queued_score[:2] == layer])
+        if not visited.add(node, path):
+            continue
+        if node in remaining:
+            remaining.discard(node)
+            yield node, path
+        before, last_edge = forward_context(path)
+        for edge, neighbor in neighbors[node]:
+            if redundant_steps(before, last_edge, edge, neighbor):
+                continue
+            new_path = path.appended((neighbor, edge))
+            if visited.beaten(neighbor, new_path):
+                continue
+            new_input = queue_input(new_path)
+            if max_sources is not None and new_input[0][0] > max_sources:
+                continue
+            heapq.heappush(queue, new_input)
+    for target in remaining:
+        yield target, None
+
+def value_shard(value, shards):
+    # Which of shards owns value in sharded_set_solution()
+    return ((value*SHARD_HASH) & 0xFFFFFFFF) % shards
+
+class SearchShard:
+    # The part of sharded_set_solution()'s search for the values value_shard()
+    # gives index: their queue and the paths popped at each of them, scored
+    # with the same forward_heuristic() set_solution_search uses
+    # A path only gets dropped for one popped at its value that beats it
+    # (MeetingPaths.beats), which is exact: whatever gets appended, the one
+    # that beats it ends up at least as good by path_set_cmp. That only needs
+    # what's been popped at its own value, which is all here, so the order
+    # paths get popped in within a layer doesn't change the answer
+    # Paths to target aren't queued, the best one is kept in found (its score
+    # is exact there), and nothing past bound ((sources, length) of a path
+    # that's known to work) gets queued either
+    def __init__(self, index, shards, target, using, belts_per_source, lower_bounds=True, bound=None):
+        self.index = index
+        self.shards = shards
+        self.target = target
+        self.bound = bound
+        using = set(using)
+        ranks = operand_ranks(using)
+        self.heuristic = forward_heuristic(target, using, ranks, lower_bounds)
+        self.queue = []
+        self.found = None
+        self.visited = MeetingPaths()
+        self.neighbors = NeighborTable(using, OPERATOR_SYMBOLS)
+        self.counts = dict.fromkeys(SEARCH_COUNTERS, 0)
+        self.belts_per_source = belts_per_source
+        self.ranks = ranks
+        self.prefixes = dict()
+        self.add(ExpressionPath([(number, (None, number))], belts_per_source, ranks) for number in using if value_shard(number, shards) == index)
+
+    def tighten(self, bound):
+        if bound is not None and (self.bound is None or bound < self.bound):
+            self.bound = bound
+
+    def add(self, paths):
+        for path in paths:
+            node = path[-1][0]
+            if node != self.target and self.visited.beaten(node, path):
+                # Cheaper than scoring it first
+                self.counts['dominated'] += 1
+                continue
+            score = self.heuristic(path)
+            if self.bound is not None and score[:2] > self.bound:
+                self.counts['pruned'] += 1
+            elif node == self.target:
+                if self.found is None or score < self.found[0]:
+                    self.found = (score, path)
+                    self.tighten(score[:2])
+                    self.counts['incumbents'] += 1
+            else:
+                heapq.heappush(self.queue, (score, path))
+                self.counts['pushed'] += 1
+
+    def receive(self, data):
+        # Adds paths from another shard's pack_children()
+        # Paths come in with the start they share with earlier ones built
+        # again, so those get kept (see unpack_path) until there's too many
+        if len(self.prefixes) > SHARD_PREFIXES:
+            self.prefixes.clear()
+        self.add(unpack_children(data, self.belts_per_source, self.ranks, self.prefixes))
+
+    def head(self):
+        # (next layer here or None once there's nothing left, (sources,
+        # length) of the best path to target here or None)
+        return self.queue[0][0][:2] if self.queue else None, None if self.found is None else self.found[0][:2]
+
+    def expand(self, layer):
+        # Pops all of layer, including whatever it adds to layer here, and
+        # returns the new paths sorted by the shard that owns them (none for
+        # this one, those are already queued), as (path, [(value, edge), ...])
+        # for pack_children()
+        outgoing = [[] for _ in range(self.shards)]
+        queue = self.queue
+        self.neighbors.expect(path[-1][0] for score, path in queue if score[:2] == layer)
+        while queue and queue[0][0][:2] == layer:
+            _, path = heapq.heappop(queue)
+            node = path[-1][0]
+            self.counts['popped'] += 1
+            if not self.visited.add(node, path):
+                self.counts['dominated'] += 1
+                continue
+            children = [[] for _ in range(self.shards)]
+            before, last_edge = forward_context(path)
+            for edge, neighbor in self.neighbors[node]:
+                if redundant_steps(before, last_edge, edge, neighbor):
+                    self.counts['redundant'] += 1
+                    continue
+                owner = value_shard(neighbor, self.shards)
+                if owner == self.index:
+                    self.add([path.appended((neighbor, edge))])
+                else:
+                    children[owner].append((neighbor, edge))
+            for owner, edges in enumerate(children):
+                if edges:
+                    outgoing[owner].append((path, edges))
+        return outgoing
+
+def shard_worker(connection, index, shards, target, using, belts_per_source, lower_bounds, bound, operator_symbols):
+    # Runs a SearchShard in its own process, told what to do over connection
+    # Every command comes with the best bound any shard has so far
+    # Paths for other shards go out in one shared memory block per shard and
+    # layer, and only the blocks' names go through the pipe
+    # Whoever reads a block unlinks it
+    # expand and add say how much CPU time they took too, so the time with a
+    # core per shard can be worked out even with fewer cores
+    use_operators(operator_symbols)
+    shard = SearchShard(index, shards, target, using, belts_per_source, lower_bounds, bound)
+    connection.send(shard.head())
+    while True:
+        command, argument, bound = connection.recv()
+        busy = time.process_time()
+        shard.tighten(bound)
+        if command == 'expand':
+            blocks = []
+            for destination, groups in enumerate(shard.expand(argument)):
+                if not groups:
+                    continue
+                data = pack_children(groups)
+                block = shared_memory.SharedMemory(create=True, size=len(data))
+                block.buf[:len(data)] = data
+                blocks.append((destination, block.name, len(data), sum(len(edges) for _, edges in groups)))
+                block.close()
+            connection.send((blocks, time.process_time()-busy))
+        elif command == 'add':
+            for name, size in argument:
+                block = shared_memory.SharedMemory(name=name)
+                data = bytes(block.buf[:size])
+                block.close()
+                block.unlink()
+                shard.receive(data)
+            connection.send((shard.head(), time.process_time()-busy))
+        elif command == 'found':
+            connection.send(None if shard.found is None else str(shard.found[1]))
+        elif command == 'counts':
+            connection.send((shard.counts, len(shard.visited)))
+        else:
+            return
+
+def sharded_set_solution(target, using, belts_per_source, processes=None, lower_bounds=True, branch_and_bound=True, stats=None, seed=None):
+    # One target's search spread over processes, for targets too slow for
+    # one core, where solve_batch() can't help
+    # It's set_solution_search's forward half with every value owned by one
+    # SearchShard (by value_shard), a layer ((sources, length) lower bound)
+    # at a time: every shard with paths in the lowest layer pops them, then
+    # the new paths get handed to the shards that own them in one batch per
+    # pair of shards, until no shard has anything in that layer left
+    # The bound (branch and bound's incumbent) is the best (sources, length)
+    # to target any shard has, starting from make_worst_path() and seed, and
+    # goes out to every shard with the next command
+    # It stops once the lowest layer left is past the bound, so every path
+    # that could tie with the best one has been looked at and the answer is
+    # the best there is by path_set_cmp, the same one minimal_set_solution
+    # gives however many shards there are (processes=1 runs it all here)
+    # stats (a dict) gets the shards' counters added up, per shard, how many
+    # rounds it took and how many paths went between shards, and in seconds
+    # 'shards' is the slowest shard's CPU time per round added up, about what
+    # it'd take with a core per shard however many cores there actually are
+    started = time.perf_counter()
+    if processes is None:
+        processes = os.cpu_count() or 1
+    using = sorted(set(using))
+    candidates = []
+    if branch_and_bound and using[0] == 1 and target not in using:
+        worst_path = make_worst_path(target, using, belts_per_source, max_length=1<<10)
+        if worst_path is not None and all(operator in OPERATOR_SYMBOLS for operator in worst_path.operator_list()):
+            candidates.append(worst_path)
+    if branch_and_bound and seed is not None:
+        candidates.append(ExpressionPath(seed, belts_per_source))
+    bound = min((path.sources(), len(path)) for path in candidates) if candidates else None
+    def tighten(head):
+        nonlocal bound
+        if head is not None and (bound is None or head < bound):
+            bound = head
+    def finished(heads):
+        # Nothing left, or nothing left that could still tie with the bound
+        layers = [layer for layer, _ in heads if layer is not None]
+        return not layers or (bound is not None and min(layers) > bound)
+    rounds = 0
+    exchanged = 0
+    critical = 0
+    if processes == 1:
+        shard = SearchShard(0, 1, target, using, belts_per_source, lower_bounds, bound)
+        heads = [shard.head()]
+        tighten(heads[0][1])
+        while not finished(heads):
+            busy = time.process_time()
+            shard.expand(heads[0][0])
+            critical += time.process_time()-busy
+            rounds += 1
+            heads = [shard.head()]
+            tighten(heads[0][1])
+        if shard.found is not None:
+            candidates.append(shard.found[1])
+        counts, visited = [shard.counts], [len(shard.visited)]
+    else:
+        connections = []
+        workers = []
+        # One resource tracker for every shard, or each would think the
+        # blocks it made and another unlinked were leaked
+        resource_tracker.ensure_running()
+        try:
+            for index in range(processes):
+                connection, worker_connection = multiprocessing.Pipe()
+                worker = multiprocessing.Process(target=shard_worker, daemon=True,
+                                                 args=(worker_connection, index, processes, target, using, belts_per_source, lower_bounds, bound, list(OPERATOR_SYMBOLS)))
+                worker.start()
+                connections.append(connection)
+                workers.append(worker)
+            heads = [connection.recv() for connection in connections]
+            for _, found in heads:
+                tighten(found)
+            while not finished(heads):
+                layer = min(head for head, _ in heads if head is not None)
+                active = [index for index, (head, _) in enumerate(heads) if head == layer]
+                for index in active:
+                    connections[index].send(('expand', layer, bound))
+                inboxes = [[] for _ in range(processes)]
+                slowest = 0
+                for index in active:
+                    blocks, seconds = connections[index].recv()
+                    slowest = max(slowest, seconds)
+                    for destination, name, size, count in blocks:
+                        inboxes[destination].append((name, size))
+                        exchanged += count
+                critical += slowest
+                rounds += 1
+                changed = [index for index in range(processes) if inboxes[index] or index in active]
+                for index in changed:
+                    connections[index].send(('add', inboxes[index], bound))
+                slowest = 0
+                for index in changed:
+                    heads[index], seconds = connections[index].recv()
+                    slowest = max(slowest, seconds)
+                    tighten(heads[index][1])
+                critical += slowest
+            counts, visited = [], []
+            for connection in connections:
+                connection.send(('found', None, None))
+                expression = connection.recv()
+                if expression is not None:
+                    candidates.append(parse_expression(expression, belts_per_source))
+                connection.send(('counts', None, None))
+                shard_counts, shard_visited = connection.recv()
+                counts.append(shard_counts)
+                visited.append(shard_visited)
+        finally:
+            for connection in connections:
+                with contextlib.suppress(OSError):
+                    connection.send(('stop', None, None))
+            for worker in workers:
+                worker.join()
+    if stats is not None:
+        stats.update((key, sum(shard_counts[key] for shard_counts in counts)) for key in SEARCH_COUNTERS)
+        stats['shards'] = [dict(shard_counts, visited=shard_visited) for shard_counts, shard_visited in zip(counts, visited)]
+        stats['rounds'] = rounds
+        stats['exchanged'] = exchanged
+        stats['seconds'] = {'total': time.perf_counter()-started, 'shards': critical}
+    if not candidates:
+        print(f"NO PATH TO {target} FOUND")
+        return None
+    return min(candidates, key=lambda path: path.set_cmp_key())
+
+def best_join(meetings, best=None):
+    # The best of every start path joined with every end path, for each
+    # (start_paths, end_paths) pair in meetings (one per value they meet at)
+    # Joining never takes away sources, so both sides get sorted by sources
+    # and anything past the best so far is skipped without being scored
+    # Returns an ExpressionJoined (or best if nothing beats it), to_path() it
+    for start_paths, end_paths in meetings:
+        end_paths = sorted(end_paths, key=ExpressionPath.sources)
+        for start_path in sorted(start_paths, key=ExpressionPath.sources):
+            if best is not None and start_path.sources() > best.sources():
+                break
+            for end_path in end_paths:
+                if best is not None and end_path.sources() > best.sources():
+                    break
+                joined = ExpressionJoined(start_path, end_path)
+                if best is None or joined.better_than(best):
+                    best = joined
+    return best
+
+def best_list_join(meetings):
+    # best_join for minimal_solution, whose paths are plain lists with the end
+    # halves reversed, scored by path_cmp's order
+    # Each half's operands and operator codes are worked out once, and joins
+    # are compared by putting those together instead of building the path
+    def start_half(path):
+        return [edge[1] for _, edge in path], [OPERATOR_CODES[edge[0]] for _, edge in path[1:]]
+    def end_half(reversed_path):
+        edges = [edge for _, edge in reversed(reversed_path[:-1])]
+        return [edge[1] for edge in edges], [OPERATOR_CODES[edge[0]] for edge in edges]
+
+    best = None
+    best_key = None
+    for start_paths, reversed_end_paths in meetings:
+        end_halves = [(reversed_path, end_half(reversed_path)) for reversed_path in reversed_end_paths]
+        for start_path in start_paths:
+            start_operands, start_codes = start_half(start_path)
+            for reversed_path, (end_operands, end_codes) in end_halves:
+                operands = start_operands+end_operands
+                operand_set = set(operands)
+                key = (len(operands), len(operand_set), max(operand_set), sum(operand_set), operands, start_codes+end_codes)
+                if best_key is None or key < best_key:
+                    best = (start_path, reversed_path)
+                    best_key = key
+    if best is None:
+        return None
+    start_path, reversed_path = best
+    return ExpressionPath(start_path+list(reversed(reversed_path))[1:])
+
+def make_worst_path(target, sorted_list, belts_per_source, max_length=None):
+    # Returns None instead if it'd be longer than max_length
     assert sorted_list[0] == 1
     tetration = False
     exponentiation = False
@@ -917,17 +2404,29 @@ def make_worst_path(target, sorted_list, belts_per_source):
                 break
     if height >= power:
         tetration = False
+    if max_length is not None:
+        if tetration:
+            length = height
+        elif exponentiation:
+            length = power
+        else:
+            length = round(target/next((num for num in reversed(sorted_list) if target % num == 0), 1))
+        if length > max_length:
+            return None
     if tetration:
         edge = ('^', tetration_base)
-        path = ExpressionPath([(tetration_base**(tetration_base**(i)), edge) for i in range(height)], belts_per_source)
+        lst = [(tetration_base**(tetration_base**(i)), edge) for i in range(height)]
     elif exponentiation:
         edge = ('*', largest_base)
-        path = ExpressionPath([(largest_base**(i+1), edge) for i in range(power)], belts_per_source)
+        lst = [(largest_base**(i+1), edge) for i in range(power)]
         # print(f"Exp = {path}")
     else:
         divisor = next((num for num in reversed(sorted_list) if target % num == 0), 1)
         edge = ('+', divisor)
-        path =  ExpressionPath([((i+1)*divisor, edge) for i in range(round(target/divisor))], belts_per_source)
+        lst = [((i+1)*divisor, edge) for i in range(round(target/divisor))]
+    # The first number has no operator, like every other path's
+    lst[0] = (lst[0][0], (None, edge[1]))
+    path = ExpressionPath(lst, belts_per_source)
 
     return path
 
@@ -958,18 +2457,21 @@ def path_cmp(a, b) -> int:
     if a_list != b_list:
         return int(a_list > b_list)*2-1
     
-    operator_dict = {'':0, '+':1, '*':2, '-':3, '/':4, '^':5}
-    operator_vals_a = [operator_dict[operator] for operator in a.operator_list()]
-    operator_vals_b = [operator_dict[operator] for operator in b.operator_list()]
+    operator_vals_a = a.operator_codes()
+    operator_vals_b = b.operator_codes()
 
     if operator_vals_a != operator_vals_b:
         return int(operator_vals_a > operator_vals_b)*2-1
     # print(f"No difference between {a} and {b}")
-    print(a, b)
-    print(a.operator_list(), b.operator_list())
     assert str(a) == str(b)
     return 0
 
+def path_cmp_key(path):
+    # path_cmp as a sort key, for plain lists as well
+    if not isinstance(path, ExpressionPath):
+        path = ExpressionPath(path)
+    return path.cmp_key()
+
 def path_set_cmp(a: ExpressionPath, b: ExpressionPath):
     # t1 = tuple([(1, (None, 1)), (2, ('+', 1)), (3, ('+', 1))])
     # t2 = tuple([(2, (None, 2)), (4, ('+', 2)), (6, ('+', 2))])
@@ -1002,6 +2504,463 @@ def parsed_solution(raw_solution):
 
     return ans
 
+def parse_expression(expression, belts_per_source=None) -> ExpressionPath:
+    # Inverse of ExpressionPath.__str__, ex. "((1+1)+1)+1" or "(7+2)+1=10"
+    # Every expression is a left-leaning chain, so the brackets carry nothing
+    expression = expression.split('=')[0].replace('(', '').replace(')', '')
+    tokens = re.findall(r'\d+|[-+*/^]', expression)
+    first_number = int(tokens[0])
+    lst = [(first_number, (None, first_number))]
+    for operator, operand in zip(tokens[1::2], tokens[2::2]):
+        operand = int(operand)
+        lst.append((operate(operator, lst[-1][0], operand), (operator, operand)))
+    return ExpressionPath(lst, belts_per_source)
+
+def scoring_hash() -> bytes:
+    # Cached solutions are only as good as the rules that picked them
+    # Hashing the compiled scorers means editing comments won't wipe a cache,
+    # but any change in how paths get ranked will
+    digest = hashlib.blake2b(digest_size=16)
+    for scorer in [path_set_cmp, path_cmp, ExpressionPath.cmp_key, ExpressionPath.set_cmp_key]:
+        digest.update(scorer.__code__.co_code)
+        digest.update(repr(scorer.__code__.co_consts).encode())
+    return digest.digest()
+
+class SolutionCache:
+    # Fixed-size open-addressed table in a memory-mapped file
+    # Header: magic, version, slot count, slot size, clock, scoring hash
+    # Slot: key digest (all 0 if empty), last use, expression length,
+    # expression
+    # The whole digest is checked on a get, so two keys only ever mix up if
+    # their 128 bit digests are the same, not just the slot they start at
+    # Keys are probed over a small window, and when the window is full the
+    # least recently used slot in it gets evicted, so the file never grows
+    MAGIC = b'BMCACHE1'
+    VERSION = 2
+    HEADER = struct.Struct('<8sIIIQ16s')
+    SLOT = struct.Struct('<16sQH')
+    EMPTY = bytes(16)
+    PROBES = 8
+
+    def __init__(self, filename, slot_count=1<<16, slot_size=128):
+        assert slot_size > self.SLOT.size
+        self.filename = filename
+        self.hits = 0
+        self.misses = 0
+        size = self.HEADER.size + slot_count*slot_size
+        exists = os.path.exists(filename)
+        fresh = not exists or os.path.getsize(filename) < self.HEADER.size
+        self.file = open(filename, 'r+b' if exists else 'w+b')
+        if not fresh:
+            magic, version, old_count, old_size, _, old_hash = self.HEADER.unpack(self.file.read(self.HEADER.size))
+            # Reuse whatever layout the file already has, unless it's stale
+            if (magic, version, old_hash) == (self.MAGIC, self.VERSION, scoring_hash()):
+                slot_count, slot_size = old_count, old_size
+                size = self.HEADER.size + slot_count*slot_size
+            else:
+                fresh = True
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        if fresh:
+            self.file.truncate(0)
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        if fresh:
+            self.HEADER.pack_into(self.map, 0, self.MAGIC, self.VERSION, slot_count, slot_size, 0, scoring_hash())
+        self.clock = self.HEADER.unpack_from(self.map, 0)[4]
+
+    @staticmethod
+    def key(solver, target, using, belts_per_source=None, operator_symbols=None):
+        if operator_symbols is None:
+            operator_symbols = OPERATOR_SYMBOLS
+        return (solver, target, tuple(sorted(set(using))), belts_per_source, tuple(sorted(operator_symbols)))
+
+    def key_digest(self, key) -> bytes:
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+        # All 0 marks an empty slot
+        return digest if digest != self.EMPTY else b'\1'+digest[1:]
+
+    def slot_offsets(self, key_digest):
+        first = int.from_bytes(key_digest[:8], 'little') % self.slot_count
+        for probe in range(min(self.PROBES, self.slot_count)):
+            yield self.HEADER.size + ((first+probe) % self.slot_count)*self.slot_size
+
+    def tick(self):
+        self.clock += 1
+        return self.clock
+
+    def get(self, key):
+        key_digest = self.key_digest(key)
+        for offset in self.slot_offsets(key_digest):
+            slot_digest, _, length = self.SLOT.unpack_from(self.map, offset)
+            if slot_digest == key_digest:
+                self.SLOT.pack_into(self.map, offset, slot_digest, self.tick(), length)
+                self.hits += 1
+                start = offset + self.SLOT.size
+                return self.map[start:start+length].decode()
+        self.misses += 1
+        return None
+
+    def put(self, key, expression):
+        encoded = expression.encode()
+        if len(encoded) > self.slot_size - self.SLOT.size:
+            # Doesn't fit in a slot, it'll just have to be solved again
+            return False
+        key_digest = self.key_digest(key)
+        chosen = None
+        oldest = None
+        for offset in self.slot_offsets(key_digest):
+            slot_digest, last_used, _ = self.SLOT.unpack_from(self.map, offset)
+            if slot_digest in {self.EMPTY, key_digest}:
+                chosen = offset
+                break
+            if oldest is None or last_used < oldest:
+                chosen, oldest = offset, last_used
+        self.SLOT.pack_into(self.map, chosen, key_digest, self.tick(), len(encoded))
+        start = chosen + self.SLOT.size
+        self.map[start:start+len(encoded)] = encoded
+        return True
+
+    def flush(self):
+        self.HEADER.pack_into(self.map, 0, self.MAGIC, self.VERSION, self.slot_count, self.slot_size, self.clock, scoring_hash())
+        self.map.flush()
+
+    def close(self):
+        if self.map.closed:
+            return
+        self.flush()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def abstract_lengths(using, limit):
+    # Fewest operands any expression could make each value up to limit with,
+    # as a bytearray indexed by value (255 if nothing gets there), plus the
+    # same for everything past limit as one value
+    # Everything past limit counts as one value (big), which can get to
+    # anything a number past limit could in one step (x-o and x/o), and
+    # there's none of the solvers' rules about which steps are allowed, so
+    # every real expression maps onto a path here at least as short
+    # That's what makes it a lower bound, even for expressions that go way
+    # past limit on the way
+    using = sorted(set(using))
+    lengths = bytearray([255])*(limit+1)
+    frontier = [number for number in using if number <= limit]
+    big_length = 1 if len(frontier) < len(using) else 255
+    for number in frontier:
+        lengths[number] = 1
+    depth = 1
+    while (frontier or big_length == depth) and depth < 254:
+        found = bytearray(limit+2)
+        if np is not None and frontier:
+            values, operands = np.broadcast_arrays(np.array(frontier, dtype=np.int64)[:, None], np.array(using, dtype=np.int64)[None, :])
+            for operator in OPERATOR_SYMBOLS:
+                results = operate_array(operator, values, operands).ravel()
+                np.frombuffer(found, dtype=np.uint8)[np.minimum(results, limit+1)] = 1
+        else:
+            for value in frontier:
+                for operator in OPERATOR_SYMBOLS:
+                    for operand in using:
+                        found[min(operate(operator, value, operand), limit+1)] = 1
+        if big_length == depth:
+            # Whatever x-o or x/o can land on from past limit
+            for operand in using:
+                ranges = [(limit+1-operand, limit)]
+                if operand > 1:
+                    ranges.append((limit//operand+1, min(limit, MAX_INT//operand)))
+                for low, high in ranges:
+                    low = max(1, low)
+                    if low <= high:
+                        found[low:high+1] = b'\1'*(high+1-low)
+        depth += 1
+        if found[limit+1] and big_length == 255:
+            big_length = depth
+        frontier = [value for value in itertools.compress(range(limit+1), found) if lengths[value] == 255]
+        for value in frontier:
+            lengths[value] = depth
+    return lengths, big_length
+
+class PatternDatabase:
+    # abstract_lengths() for some allowed numbers, saved so it only ever gets
+    # worked out once and memory-mapped back in
+    # Header: magic, version, limit, fewest operands for anything past
+    # limit, operators as bits by OPERATOR_CODES, how many allowed numbers,
+    # then the allowed numbers and a byte per value up to limit
+    # length() is a lower bound on how many operands an expression for a
+    # value needs and sources() on how many sources, so they're admissible for
+    # minimal_set_solution (see pattern_db there)
+    # Lengths only depend on the allowed numbers and operators, so one file
+    # does for every belts_per_source
+    MAGIC = b'BMPATDB1'
+    VERSION = 2
+    HEADER = struct.Struct('<8sIIIBI')
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.limit, self.big_length, operator_bits, count = self.HEADER.unpack_from(self.map, 0)
+        assert (magic, version) == (self.MAGIC, self.VERSION), f"{filename} isn't a pattern database"
+        self.operator_symbols = [symbol for code, symbol in enumerate(OPERATORS_BY_CODE) if operator_bits >> code & 1]
+        self.using = list(struct.unpack_from(f'<{count}I', self.map, self.HEADER.size))
+        self.offset = self.HEADER.size + 4*count
+
+    @classmethod
+    def build(cls, filename, using, limit=SIEVE_LIMIT):
+        # Works the table out for OPERATOR_SYMBOLS and writes it with
+        # atomic_write()
+        using = sorted(set(using))
+        lengths, big_length = abstract_lengths(using, limit)
+        operator_bits = sum(1 << OPERATOR_CODES[symbol] for symbol in OPERATOR_SYMBOLS)
+        header = cls.HEADER.pack(cls.MAGIC, cls.VERSION, limit, big_length, operator_bits, len(using))
+        with atomic_write(filename) as f:
+            f.write(header + struct.pack(f'<{len(using)}I', *using) + lengths)
+        return cls(filename)
+
+    @classmethod
+    def load(cls, filename, using, limit=SIEVE_LIMIT):
+        # The one in filename, built first if it's missing or for other
+        # numbers or operators
+        if os.path.exists(filename):
+            database = cls(filename)
+            if database.matches(using) and database.limit >= limit:
+                return database
+            database.close()
+        return cls.build(filename, using, limit)
+
+    def matches(self, using, operator_symbols=None):
+        if operator_symbols is None:
+            operator_symbols = OPERATOR_SYMBOLS
+        return (self.using, set(self.operator_symbols)) == (sorted(set(using)), set(operator_symbols))
+
+    def length(self, value):
+        if value > self.limit:
+            return self.big_length
+        return self.map[self.offset+value]
+
+    def sources(self, value, belts_per_source):
+        return -(-self.length(value) // belts_per_source)
+
+    def close(self):
+        if self.map.closed:
+            return
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class CostTableFile(Mapping):
+    # Solved targets written out so other tools (or later runs) can look any
+    # of them up without parsing printed paths or searching again
+    # Header: magic, version, how many targets are solved, belts_per_source
+    # (0 without), operators as bits by OPERATOR_CODES, how many allowed
+    # numbers, scoring hash, then the allowed numbers, the solved targets in
+    # order, count+1 offsets into the records and the records themselves
+    # Record: sources, length, then length operands and length-1 operator
+    # codes, unsolved targets aren't in the file at all
+    # Targets can be as far apart as they like without the file growing
+    # Memory-mapped, so looking a target up is a binary search over the
+    # targets, two offsets and one record
+    # {target: (sources, path)} like set_cost_table()'s CostTable
+    MAGIC = b'BMCOSTS1'
+    VERSION = 3
+    HEADER = struct.Struct('<8sIIIBI16s')
+    # 32 bits each, same as ExpressionStore's lengths and sources
+    RECORD = struct.Struct('<II')
+    OFFSETS = struct.Struct('<QQ')
+    TARGET = struct.Struct('<I')
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.count, belts_per_source, operator_bits,
+         using_count, self.scoring) = self.HEADER.unpack_from(self.map, 0)
+        assert (magic, version) == (self.MAGIC, self.VERSION), f"{filename} isn't a cost table"
+        self.belts_per_source = belts_per_source or None
+        self.operator_symbols = [symbol for code, symbol in enumerate(OPERATORS_BY_CODE) if operator_bits >> code & 1]
+        self.using = list(struct.unpack_from(f'<{using_count}I', self.map, self.HEADER.size))
+        self.targets_offset = self.HEADER.size + 4*using_count
+        self.index_offset = self.targets_offset + 4*self.count
+        self.data_offset = self.index_offset + 8*(self.count+1)
+
+    @classmethod
+    def encode(cls, path, belts_per_source=None):
+        # Sources are counted here with belts_per_source, whatever (if
+        # anything) path was built with
+        path = ExpressionPath(path)
+        operands = path.operand_list()
+        codes = path.operator_codes()
+        sources = 0
+        if belts_per_source is not None:
+            sources = sum(-(-path.occurence(operand) // belts_per_source) for operand in path.operand_set())
+        return cls.RECORD.pack(sources, len(operands)) + struct.pack(f'<{len(operands)}I', *operands) + bytes(codes)
+
+    @classmethod
+    def write_records(cls, filename, records, using, belts_per_source=None, operator_symbols=None, scoring=None):
+        # records is {target: encode()d path}, written with atomic_write()
+        if operator_symbols is None:
+            operator_symbols = OPERATOR_SYMBOLS
+        using = sorted(set(using))
+        targets = array.array('I', sorted(target for target, record in records.items() if record))
+        offsets = array.array('Q', [0])
+        data = bytearray()
+        for target in targets:
+            data += records[target]
+            offsets.append(len(data))
+        operator_bits = sum(1 << OPERATOR_CODES[symbol] for symbol in operator_symbols)
+        header = cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(targets), belts_per_source or 0,
+                                 operator_bits, len(using), scoring or scoring_hash())
+        if sys.byteorder != 'little':
+            targets.byteswap()
+            offsets.byteswap()
+        with atomic_write(filename) as f:
+            f.write(header + struct.pack(f'<{len(using)}I', *using))
+            f.write(targets.tobytes())
+            f.write(offsets.tobytes())
+            f.write(data)
+        return cls(filename)
+
+    @classmethod
+    def write(cls, filename, solutions, using, belts_per_source=None, operator_symbols=None):
+        # solutions is {target: path}, targets without a path are left out
+        records = dict((target, cls.encode(path, belts_per_source)) for target, path in solutions.items() if path is not None)
+        return cls.write_records(filename, records, using, belts_per_source, operator_symbols)
+
+    @classmethod
+    def merge(cls, filename, filenames):
+        # One table out of shards solved separately for the same settings,
+        # where two have the same target the better path (by path_set_cmp, or
+        # path_cmp without belts_per_source) is kept
+        # filename can be one of filenames
+        tables = [cls(name) for name in filenames]
+        try:
+            first = tables[0]
+            for table in tables[1:]:
+                assert (table.using, table.belts_per_source, table.operator_symbols, table.scoring) == (first.using, first.belts_per_source, first.operator_symbols, first.scoring), f"{table.filename} isn't for the same settings as {first.filename}"
+            records = dict()
+            owners = dict()
+            for table in tables:
+                for target in table:
+                    if target in records:
+                        # Only targets more than one shard has get decoded
+                        key = ExpressionPath.set_cmp_key if first.belts_per_source is not None else ExpressionPath.cmp_key
+                        if key(owners[target].path(target)) <= key(table.path(target)):
+                            continue
+                    records[target] = table.raw(target)
+                    owners[target] = table
+        finally:
+            for table in tables:
+                table.close()
+        return cls.write_records(filename, records, first.using, first.belts_per_source, first.operator_symbols, first.scoring)
+
+    def matches(self, using, belts_per_source=None, operator_symbols=None):
+        if operator_symbols is None:
+            operator_symbols = OPERATOR_SYMBOLS
+        return (self.using, self.belts_per_source, set(self.operator_symbols)) == (sorted(set(using)), belts_per_source, set(operator_symbols))
+
+    def target(self, index):
+        return self.TARGET.unpack_from(self.map, self.targets_offset + 4*index)[0]
+
+    def raw(self, target):
+        # The encode()d record for target, b'' if it's not solved
+        low, high = 0, self.count
+        while low < high:
+            middle = (low+high)//2
+            if self.target(middle) < target:
+                low = middle+1
+            else:
+                high = middle
+        if low == self.count or self.target(low) != target:
+            return b''
+        start, end = self.OFFSETS.unpack_from(self.map, self.index_offset + 8*low)
+        return self.map[self.data_offset+start:self.data_offset+end]
+
+    def path(self, target):
+        # The ExpressionPath for target, None if it's not solved
+        record = self.raw(target)
+        if not record:
+            return None
+        _, length = self.RECORD.unpack_from(record)
+        operands = struct.unpack_from(f'<{length}I', record, self.RECORD.size)
+        codes = record[self.RECORD.size+4*length:]
+        lst = [(operands[0], (None, operands[0]))]
+        for code, operand in zip(codes, operands[1:]):
+            operator = OPERATORS_BY_CODE[code]
+            lst.append((operate(operator, lst[-1][0], operand), (operator, operand)))
+        return ExpressionPath(lst, self.belts_per_source)
+
+    def sources(self, target):
+        record = self.raw(target)
+        if not record:
+            raise KeyError(target)
+        return self.RECORD.unpack_from(record)[0]
+
+    def __getitem__(self, target):
+        path = self.path(target)
+        if path is None:
+            raise KeyError(target)
+        return self.RECORD.unpack_from(self.raw(target))[0], path
+
+    def __contains__(self, target):
+        return bool(self.raw(target))
+
+    def __iter__(self):
+        return iter(struct.unpack_from(f'<{self.count}I', self.map, self.targets_offset))
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self.map.closed:
+            return
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def cached_solution(cache, solver, target, using, belts_per_source=None, **options):
+    # Puts a SolutionCache in front of minimal_solution/minimal_set_solution
+    # options go to solver as they are on a miss. They're not part of the key
+    # since none of them change the answer (seed and require as long as
+    # they're used like update_set_solutions does), only how long it takes
+    # and what goes in stats. A hit doesn't run solver, so stats only gets
+    # 'cached' set
+    if solver is minimal_set_solution:
+        key = cache.key('set', target, using, belts_per_source)
+    else:
+        key = cache.key('min', target, using)
+    expression = cache.get(key)
+    if expression is not None:
+        # Slots keep the whole key's digest, so this is the answer for this
+        # target with these numbers, belts_per_source and operators
+        if options.get('stats') is not None:
+            options['stats']['cached'] = True
+        return parse_expression(expression, belts_per_source)
+    if solver is minimal_set_solution:
+        path = solver(target, using, belts_per_source, **options)
+    else:
+        path = solver(target, using, **options)
+    if path is not None:
+        # Same type a hit gives, minimal_solution hands back a plain list
+        # when target is one of using
+        path = ExpressionPath(path, belts_per_source)
+        cache.put(key, str(path))
+    return path
+
 def test_div(allowed_numbers, last):
     for i in range(1, last+1):
         solution = minimal_solution(i, allowed_numbers)
@@ -1061,6 +3020,41 @@ def path_test_2():
     assert path1 == path2
 
 
+def path_test_3():
+    path = ExpressionPath([(2, (None, 2))], 2)
+    assert not hasattr(path, '__dict__')
+    path = path.appended((4, ('+', 2))).appended((16, ('^', 2))).appended((17, ('+', 1)))
+    assert str(path) == "((2+2)^2)+1"
+    assert path.operand_set() == {1, 2}
+    assert path.occurence(2) == 3 and path.occurence(1) == 1 and path.occurence(5) == 0
+    assert path.sources() == 3
+    assert path.max_occurence() == 3
+    assert path.max_operand() == 2
+    assert path.sum() == 7
+    assert path.operator_codes() == [1, 5, 1]
+    # Counts are packed by rank, however big the operand is
+    big = ExpressionPath([(7000000, (None, 7000000))], 2).appended((7000001, ('+', 1)))
+    assert big.operand_mask == 0b11 and big.occurence_counts.bit_length() <= 2*OCCURENCE_BITS
+    assert big.occurence(7000000) == 1 and big.occurence(1) == 1 and big.operand_set() == {1, 7000000}
+    ranks = operand_ranks([3, 1, 2])
+    assert ranks is operand_ranks([1, 2, 3]) and ranks.operands == (1, 2, 3)
+    path = ExpressionPath([(3, (None, 3)), (6, ('*', 2))], 2, ranks)
+    assert path.operand_ranks is ranks and path.operand_mask == 0b110
+    # The parent isn't touched by appending
+    shorter = ExpressionPath([(2, (None, 2)), (4, ('+', 2))], 2)
+    longer = shorter.appended((8, ('*', 2)))
+    assert shorter.occurence(2) == 2 and shorter.sources() == 1
+    assert longer.occurence(2) == 3 and longer.sources() == 2
+
+    # Every use is its own source
+    path = ExpressionPath([(3, (None, 3)), (9, ('*', 3))], 1)
+    assert path.sources() == 2
+
+    end_path = ExpressionEnd([], 9, 10).appended((10, ('+', 1)), 9).appended((9, ('*', 3)), 3)
+    assert str(end_path) == "(3*3)+1=10"
+    assert end_path.operator_codes() == [2, 1]
+    assert end_path.sources() == 2
+
 def score_tests():
     path_score = functools.cmp_to_key(path_cmp)
 
@@ -1094,6 +3088,22 @@ def score_tests():
     path_a, path_b = ExpressionPath(path_a), ExpressionPath(path_b)
     assert path_score(path_a) < path_score(path_b)
 
+def score_key_test_1():
+    # The tuple keys sort exactly like the comparison functions
+    paths = [ExpressionPath([(number, (None, number))], 2) for number in [1, 2, 3, 31]]
+    for length in range(2):
+        paths += [path.appended((operate(operator, path[-1][0], operand), (operator, operand)))
+                  for path in paths if len(path) == length+1 for operator in OPERATOR_SYMBOLS for operand in [1, 2, 31]]
+    # path_cmp complains about equal paths, same values and edges are the same path
+    paths = list(dict((tuple(path), path) for path in paths).values())
+    for scorer, key in [(path_cmp, ExpressionPath.cmp_key), (path_set_cmp, ExpressionPath.set_cmp_key)]:
+        path_score = functools.cmp_to_key(scorer)
+        assert [str(path) for path in sorted(paths, key=path_score)] == [str(path) for path in sorted(paths, key=key)]
+    assert path_cmp_key([(1, (None, 1)), (2, ('+', 1))]) == paths[0].appended((2, ('+', 1))).cmp_key()
+    # End paths list their operands in the order they're joined in
+    end_path = ExpressionEnd([], 2, 10).appended((10, ('+', 1)), 9).appended((9, ('*', 3)), 3)
+    assert end_path.tie_key() == (replace_base([1, 3], 1 << OPERAND_BITS), replace_base([1, 2], 1 << CODE_BITS))
+
 def score_set_tests():
     path_score = functools.cmp_to_key(path_set_cmp)
 
@@ -1164,10 +3174,419 @@ def test_3():
     result = minimal_solution(number, allowed_numbers)
     assert str(result) == "((31^31)-1)/31"
 
-def subset_test_1():
-    s = {1, 2}
-    assert non_empty_subsets(s) == [{1}, {2}, {1, 2}]
-    assert all_subsets(s) == [set(), {1}, {2}, {1, 2}]
+def lower_bound_test_1():
+    allowed_numbers = [2, 3, 7]
+    for value in [1, 2, 5, 30, 1000]:
+        reachable, _ = step_depths([value], allowed_numbers, max_depth=2, max_size=MAX_INT)
+        for number, steps in reachable.items():
+            assert min_steps(value, number, max(allowed_numbers)) <= steps
+            if number < 200:
+                back, depth = step_depths([number], allowed_numbers, max_depth=2, backward=True, max_size=MAX_INT)
+                assert depth == 2 and back[value] == steps
+    assert min_steps(5, 5, 7) == 0
+    assert min_steps(1, 10, 1) == 9
+    assert min_steps(2, 2**49, 7) == 2
+
+    # Has to find the very same paths as without them
+    for belts_per_source in [2, 3, 100]:
+        for number in range(4, 40):
+            result = minimal_set_solution(number, allowed_numbers, belts_per_source)
+            plain = minimal_set_solution(number, allowed_numbers, belts_per_source, lower_bounds=False)
+            assert result[-1][0] == number
+            assert str(result) == str(plain)
+
+def branch_bound_test_1():
+    allowed_numbers = [1, 2, 3, 7]
+    for belts_per_source in [2, 3]:
+        for number in [4, 9, 31, 100, 997]:
+            stats = dict()
+            result = minimal_set_solution(number, allowed_numbers, belts_per_source, stats=stats)
+            plain = minimal_set_solution(number, allowed_numbers, belts_per_source, branch_and_bound=False)
+            assert str(result) == str(plain)
+            assert stats['incumbent'] == str(result)
+            assert stats['popped'] > 0 and stats['pushed'] > 0
+
+    # Nothing beats make_worst_path here, so it's all that's left
+    stats = dict()
+    result = minimal_set_solution(4, [1], 1000, stats=stats)
+    assert str(result) == "((1+1)+1)+1"
+    assert stats['incumbent'] == "((1+1)+1)+1"
+    assert make_worst_path(1000, [1, 2], 100, max_length=100) is None
+    assert len(make_worst_path(1000, [1, 2], 100, max_length=500)) == 500
+    for number in [16, 27, 1000]:
+        worst_path = make_worst_path(number, [1, 2, 3], 100)
+        assert worst_path[0][1][0] is None and worst_path.encoded_codes >> CODE_BITS*(len(worst_path)-1) == 0
+        assert worst_path.cmp_key() == parse_expression(str(worst_path), 100).cmp_key()
+
+def benchmark_test_1():
+    # Just the plumbing, run_benchmarks() itself is too slow for here
+    name, result = benchmark_job(('test', [9, 31], [1, 2, 3, 7], 2, None))
+    assert result['timeouts'] == 0 and result['nodes'] > 0
+    assert result['answers']['31'] == str(minimal_set_solution(31, [1, 2, 3, 7], 2))
+    assert compare_benchmarks({'cases': {name: result}}, {'cases': {name: result}}) == []
+    worse = json.loads(json.dumps(result))
+    worse['nodes'] *= 2
+    worse['sources']['31'] += 1
+    assert len(compare_benchmarks({'cases': {name: result}}, {'cases': {name: worse}})) == 2
+    assert benchmark_summary({'cases': {name: worse}}) == [f"test: {round(result['seconds'], 3)}s, {worse['nodes']} nodes, 0 timeouts, peak {result['peak_memory']}"]
+    assert any(case[0] == 'equation-1-min' for case in benchmark_cases())
+
+def spill_test_1():
+    global SPILL_CHECK_POPS
+    # Spilling everything after every pop still has to give the same answers
+    check_pops = SPILL_CHECK_POPS
+    SPILL_CHECK_POPS = 1
+    try:
+        for number, allowed_numbers, belts_per_source in [(58759, [9, 29], 9), (2024, [1, 3, 5, 11], 4), (997, [1, 2, 3, 7], 2)]:
+            result = minimal_set_solution(number, allowed_numbers, belts_per_source, memory_limit=1)
+            assert str(result) == str(minimal_set_solution(number, allowed_numbers, belts_per_source))
+    finally:
+        SPILL_CHECK_POPS = check_pops
+
+    # Whatever comes back from disk is the same path
+    path = parse_expression("((3+7)^3)-3", 2)
+    queue = [((1, 1), parse_expression("3+7", 2)), ((2, 5), path)]
+    spill = FrontierSpill(2)
+    spill.spill(queue, (1, 1))
+    assert len(queue) == 1 and len(spill) == 1
+    assert spill.restore(queue, queue[0][0][:2], lambda path: ((2, 5), path)) == (1, 1)
+    queue.pop()
+    assert spill.restore(queue, None, lambda path: ((2, 5), path)) == (2, 5)
+    assert str(queue[0][1]) == str(path) and queue[0][1].occurence_counts == path.occurence_counts
+    assert len(spill) == 0
+
+def meeting_test_1():
+    paths = MeetingPaths()
+    assert paths.add(4, parse_expression("3+1", 2))
+    # Same operands, wins on tie_key so 3+1 goes
+    assert paths.add(4, parse_expression("1+3", 2)) and len(paths[4]) == 1
+    assert not paths.add(4, parse_expression("1*3", 2))
+    # Longer with more of every operand
+    assert not paths.add(4, parse_expression("(1+3)*1", 2))
+    # Needs a 2 instead, could still join better
+    assert paths.add(4, parse_expression("2+2", 2))
+    assert [str(path) for path in paths[4]] == ["1+3", "2+2"]
+    # Fewer kinds of operand for as many sources isn't beating it
+    assert paths.add(4, parse_expression("((1+1)+1)+1", 2)) and len(paths[4]) == 3
+    # Same as above when they share their OperandRanks
+    ranks = operand_ranks([1, 2, 3])
+    paths = MeetingPaths()
+    assert paths.add(4, ExpressionPath([(1, (None, 1)), (4, ('+', 3))], 2, ranks))
+    assert not paths.add(4, ExpressionPath([(1, (None, 1)), (1, ('*', 1)), (4, ('+', 3))], 2, ranks))
+    assert paths.add(4, ExpressionPath([(2, (None, 2)), (4, ('+', 2))], 2, ranks)) and len(paths[4]) == 2
+
+def stats_test_1():
+    stats = dict()
+    result = minimal_set_solution(997, [1, 2, 3, 7], 2, stats=stats)
+    assert json.loads(stats_json(stats)) == stats
+    assert stats['incumbent'] == str(result)
+    for key in SEARCH_COUNTERS:
+        assert stats[key] == sum(counts[key] for counts in stats['directions'].values())
+        assert stats[key] == sum(entry[key] for entry in stats['layers'])
+    assert stats['directions']['forward']['popped'] > 0
+    assert stats['peak_frontier']['forward'] == max(entry['frontier'] for entry in stats['layers'])
+    assert stats['seconds']['forward'] <= stats['seconds']['total']
+
+def anytime_test_1():
+    allowed_numbers = [1, 2, 3, 7]
+    for belts_per_source in [2, 3]:
+        for number in [9, 100, 997]:
+            search = AnytimeSearch(number, allowed_numbers, belts_per_source)
+            while not search.done:
+                path, lower_bound, gap = search.run(pops=50)
+                assert path is None or lower_bound <= path.sources()
+            assert str(path) == str(minimal_set_solution(number, allowed_numbers, belts_per_source))
+            assert gap == 0 and lower_bound == path.sources()
+
+    # Too few pops to prove anything, but make_worst_path is there from the start
+    search = AnytimeSearch(997, allowed_numbers, 2)
+    path, lower_bound, gap = search.run(pops=1)
+    assert not search.done
+    assert path is not None and gap == path.sources()-lower_bound
+
+    # No 1 means no make_worst_path, and minimal_solution can't find this one
+    # in time, but the search still goes on with every run() after that
+    search = AnytimeSearch(3988839, [2, 3, 5, 7], 9)
+    search.run(seconds=0.01)
+    for _ in range(3):
+        pops = search.pops
+        search.run(seconds=0.05)
+        assert search.pops > pops
+
+def store_test_1():
+    store = ExpressionStore(2)
+    path = parse_expression("(((2+2)^2)-2)/2", 2)
+    handle = store.add(path)
+    assert str(store.path(handle)) == str(path)
+    assert store.sources(handle) == path.sources() == 3
+    assert store.length(handle) == 5 and store.value(handle) == 7
+    assert store.sum(handle) == 10 and store.max_operand(handle) == 2
+    # Equal paths are the same handle, shared prefixes are only stored once
+    assert store.add(parse_expression("(((2+2)^2)-2)/2", 2)) == handle
+    assert len(store) == 5
+    other = store.add(parse_expression("((2+2)^2)+1", 2))
+    assert other != handle and len(store) == 6
+    assert store.append(handle, path.appended((8, ('+', 1)))) == store.add(parse_expression("((((2+2)^2)-2)/2)+1", 2))
+    # Enough nodes to make the table grow
+    for number in range(1, 2000):
+        store.add(ExpressionPath([(number, (None, number))], 2))
+    assert str(store.path(other)) == "((2+2)^2)+1"
+    assert store.add(path) == handle
+    # Lengths and sources don't wrap around at 16 bits
+    handle = -1
+    for length in range(1, (1 << 16)+2):
+        handle = store.node(handle, length, 1, 1, length)
+    assert store.length(handle) == (1 << 16)+1 and store.sources(handle) == (1 << 15)+1
+
+def expand_test_1():
+    global NUMPY_MIN_EDGES
+    values = [1, 2, 7, 8, 27, 64, 100, 961, 1 << 30, MAX_INT-1, MAX_INT]
+    operands = [1, 2, 3, 5, 31]
+    for backward in [False, True]:
+        expected = []
+        for index, value in enumerate(values):
+            for operator in OPERATOR_SYMBOLS:
+                for operand in operands:
+                    if backward:
+                        neighbor = invert(operator, operand, value)
+                    else:
+                        neighbor = operate(operator, value, operand)
+                    if neighbor != value and (value if backward else neighbor) != operand and neighbor > 0:
+                        expected.append((index, operator, operand, neighbor))
+        # Both the NumPy and the plain version
+        minimum_edges = NUMPY_MIN_EDGES
+        for NUMPY_MIN_EDGES in [0, float('inf')]:
+            assert list(zip(*expand_values(values, operands, backward=backward))) == expected
+        # The plain version again, looked up in a NumberIndex, past its sieve too
+        assert list(zip(*expand_values(values, operands, backward=backward, number_index=NumberIndex(operands, limit=100)))) == expected
+        NUMPY_MIN_EDGES = minimum_edges
+    # Only exact roots go backwards
+    assert (3, '^', 3, 2) in expected
+    assert (7, '^', 2, 31) in expected
+    assert (4, '^', 2, 5) not in expected
+    # 27 = 3^3 steps back onto its operand, but nothing steps back from one
+    assert (4, '^', 3, 3) in expected
+    assert not any(index == 1 and operand == 2 for index, _, operand, _ in expected)
+
+    neighbors = NeighborTable([2, 3], backward=True)
+    neighbors.expect([8, 9, 25, 27])
+    assert (('^', 2), 3) in neighbors[9]
+    # The second miss brings an expected value along with it
+    assert (('^', 3), 5) in neighbors[125]
+    assert len(neighbors.neighbors) == 3
+    assert (('*', 2), 4) in neighbors[8]
+
+def number_index_test_1():
+    factors = smallest_prime_factors(1000)
+    for value in range(2, 1001):
+        prime = min(divisor for divisor in range(2, value+1) if value % divisor == 0)
+        assert factors[value] == prime
+    # Built once, and then only when something asks for more
+    sieve = shared_sieve(1000)
+    assert shared_sieve(500) is sieve and len(sieve) > 1000
+    operands = [1, 2, 3, 4, 5, 8, 17, 31]
+    index = NumberIndex(operands, limit=1000)
+    for value in list(range(1, 1001))+[69273666, 1 << 30, 3**19, MAX_INT-1, MAX_INT]:
+        assert index.divisors(value) == [operand for operand in operands if value % operand == 0]
+        if value <= 1000:
+            # Nothing past 31**2 has a root over 31
+            assert index.roots(value) == [(operand, root) for operand in operands if operand > 1 for root in range(2, 32) if root**operand == value]
+    assert index.roots(1 << 30) == [(2, 1 << 15), (3, 1 << 10), (5, 1 << 6)]
+    # Right at the top, where rounding a float root used to be trusted
+    assert invert('^', 2, 46340**2) == 46340
+    assert invert('^', 2, 46340**2-1) == 46340**2-1
+    assert invert('^', 3, 1290**3) == 1290
+    assert integer_root(MAX_INT, 31) is None and integer_root(1 << 30, 30) == 2
+
+def pattern_db_test_1():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "test.patterns")
+        for using in [[1, 2], [3, 7, 29], [1, 2, 3, 4, 5, 6, 7, 8, 9]]:
+            with PatternDatabase.load(filename, using, limit=300) as database:
+                assert database.matches(using) and not database.matches(using, '+*')
+                for value in range(1, 301):
+                    path = minimal_solution(value, using)
+                    assert database.length(value) <= len(path)
+                # Far past the table, and still admissible
+                for value in [1000, 4097]:
+                    assert database.length(value) <= len(minimal_solution(value, using))
+                # The same file for any belts_per_source
+                for belts_per_source in [2, 3]:
+                    for value in [1, 7, 50, 123, 300, 1000]:
+                        expected = minimal_set_solution(value, using, belts_per_source)
+                        assert database.sources(value, belts_per_source) <= expected.sources()
+                        assert str(minimal_set_solution(value, using, belts_per_source, pattern_db=database)) == str(expected)
+        # The last one stays on disk, and comes back as it was
+        with PatternDatabase(filename) as database:
+            assert database.using == list(range(1, 10)) and database.limit == 300
+            assert database.length(8) == 1 and database.length(10) == 2
+            assert database.operator_symbols == OPERATORS_BY_CODE[1:] and database.length(256) == 2
+        # Fewer operators make longer expressions, so it gets built again
+        use_operators('+*')
+        try:
+            with PatternDatabase.load(filename, range(1, 10), limit=300) as database:
+                # 4^4 is out, 8*8*4 isn't
+                assert database.operator_symbols == ['+', '*'] and database.length(256) == 3
+        finally:
+            use_operators(OPERATORS_BY_CODE[1:])
+
+def update_test_1():
+    for allowed_numbers, added, belts_per_source in [([1, 2], [3], 2), ([2, 3, 7], [5], 3), ([1, 2, 3, 4, 5], [7, 9], 9)]:
+        numbers = range(1, 40)
+        previous = dict((number, minimal_set_solution(number, allowed_numbers, belts_per_source)) for number in numbers)
+        solutions, changed = update_set_solutions(previous, allowed_numbers, added, belts_per_source)
+        for number in numbers:
+            expected = minimal_set_solution(number, allowed_numbers+added, belts_per_source)
+            assert str(solutions[number]) == str(expected)
+            assert (number in changed) == (str(expected) != str(previous[number]))
+        assert all(str(changed[number][0]) == str(previous[number]) for number in changed)
+    # 2+2 can't get any better with a 3, so it isn't searched again, and a
+    # number that had no path before gets one
+    previous = {4: minimal_set_solution(4, [1, 2], 2), 3: None}
+    solutions, changed = update_set_solutions(previous, [1, 2], [3], 2)
+    assert solutions[4] is previous[4] and 4 not in changed
+    assert str(solutions[3]) == "3" and changed[3] == (None, solutions[3])
+
+def cli_test_1():
+    assert parse_numbers("1-3, 7 9..11 # 12") == [1, 2, 3, 7, 9, 10, 11]
+    allowed_numbers = [1, 2, 3]
+    numbers = list(range(1, 25))
+    expected = dict((number, str(minimal_set_solution(number, allowed_numbers, 9))) for number in numbers)
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "out.txt")
+        solved, unsolved = batch_solve(numbers[:10], allowed_numbers, 9, output, processes=2)
+        assert (solved, unsolved) == (10, [])
+        # Stopped partway through a line, resuming drops it and does the rest
+        with open(output, 'a') as f:
+            f.write("((1+1")
+        assert finished_targets(output) == set(numbers[:10])
+        solved, unsolved = batch_solve(numbers+numbers[:5], allowed_numbers, 9, output, 'jsonl', processes=2, resume=True)
+        assert (solved, unsolved) == (len(numbers)-10, [])
+        with open(output) as f:
+            lines = f.read().splitlines()
+        assert len(lines) == len(numbers)
+        for line in lines[:10]:
+            expression, number = line.split('=')
+            assert expected[int(number)] == expression
+        for line in lines[10:]:
+            record = json.loads(line)
+            assert record['expression'] == expected[record['target']]
+            assert record['sources'] == parse_expression(record['expression'], 9).sources()
+    # Fewer operators
+    try:
+        use_operators('+*')
+        assert [str(path) for _, path in solve_batch([5, 64], [2, 3], processes=1)] == ["2+3", "((((2+2)*2)*2)*2)*2"]
+        assert str(minimal_set_solution(12, [2, 3], 9)) == "(3*3)+3"
+    finally:
+        use_operators(OPERATORS_BY_CODE[1:])
+    assert OPERATOR_SYMBOLS == ['+', '*', '-', '/', '^']
+
+def verify_test_1():
+    lines = ["(((((9*9)*9)*9)-29)*9)-29=58759", "", "# comment", "(2-5)+1=3", "(12/5)/2=6",
+             "(7*7)^9=" + str(MAX_INT), "1+1=3", "(1+x)+1=3", "2%2=1", "0+1=1", "4+4=8",
+             json.dumps({'target': 7, 'expression': "((1+2)*2)+1", 'sources': 2}),
+             json.dumps({'target': 7, 'expression': "((1+2)*2)+1", 'sources': 3}), "(2+2)+2"]
+    checked, mismatches, verified = verify_lines(lines, 2, [1, 2, 5, 7, 9, 12, 29], keep=True)
+    assert checked == 12
+    assert mismatches == [(7, 'value', "1+1=3"), (8, 'unparsable', "(1+x)+1=3"), (9, 'unparsable', "2%2=1"),
+                          (10, 'unparsable', "0+1=1"), (11, 'operand', "4+4=8"), (13, 'sources', lines[12])]
+    assert [(target, sources) for target, _, sources in verified] == [(58759, 4), (3, 3), (6, 3), (MAX_INT, 2), (7, 2), (6, 2)]
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "equations.txt")
+        with open(filename, 'w') as f:
+            f.write('\n'.join(lines*3)+'\n')
+        for processes in [None, 2]:
+            search = verify_expressions(filename, 2, processes=processes, chunk_lines=5)
+            found = list(itertools.islice(search, 15))
+            assert [line_number for line_number, _, _ in found] == [line_number+i*len(lines) for i in range(3) for line_number in [7, 8, 9, 10, 13]]
+            try:
+                next(search)
+            except StopIteration as stop:
+                assert stop.value == 36
+        with SolutionCache(os.path.join(directory, "test.cache")) as cache:
+            assert list(verify_expressions(filename, 100, [1, 2], cache=cache)) != []
+            assert str(minimal_set_solution(7, [1, 2], 100, cache)) == "((1+2)*2)+1"
+            assert cache.hits == 1
+        try:
+            use_operators('+*')
+            assert verify_lines(["(1+2)-1=2", "(1+2)*2=6"])[1] == [(1, 'operator', "(1+2)-1=2")]
+        finally:
+            use_operators(OPERATORS_BY_CODE[1:])
+
+def service_test_1():
+    allowed_numbers = [1, 2, 3, 4, 5]
+    with tempfile.TemporaryDirectory() as directory, SolverService(processes=2, patterns=directory) as service:
+        loop = asyncio.new_event_loop()
+        path = os.path.join(directory, "solver.sock")
+        servers = [loop.run_until_complete(service.start(path=path)), loop.run_until_complete(service.start(port=0))]
+        port = servers[1].sockets[0].getsockname()[1]
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            request = {'targets': [79, 100, 2, 79], 'allowed': allowed_numbers, 'belts': 9, 'id': 1}
+            for address in [{'path': path}, {'port': port}]:
+                answers = list(query(request, **address))
+                assert sorted(answer['target'] for answer in answers) == [2, 79, 100]
+                for answer in answers:
+                    assert answer['id'] == 1
+                    assert answer['expression'] == str(minimal_set_solution(answer['target'], allowed_numbers, 9))
+            # Straight from memory the second time
+            assert len(service.solved[service.configuration(request)]) == 3
+            answer, = query({'target': 4, 'allowed': [1, 2], 'operators': '+'}, path)
+            assert (answer['expression'], answer['length'], 'sources' in answer) == ("2+2", 2, False)
+            answer, = query({'target': 4, 'allowed': [1, 2], 'operators': '+x'}, port=port)
+            assert 'error' in answer and 'target' not in answer
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            for server in servers:
+                server.close()
+                loop.run_until_complete(server.wait_closed())
+            # Connections the clients already closed, that the loop stopped
+            # before noticing
+            pending = asyncio.all_tasks(loop)
+            if pending:
+                loop.run_until_complete(asyncio.wait(pending))
+            loop.close()
+
+def redundant_test_1():
+    assert redundant_steps(5, ('+', 3), ('-', 3), 5)
+    assert redundant_steps(5, ('*', 7), ('/', 7), 5, reorder=True)
+    assert not redundant_steps(5, ('+', 7), ('+', 3), 15)
+    assert redundant_steps(5, ('+', 7), ('+', 3), 15, reorder=True)
+    assert not redundant_steps(5, ('+', 3), ('+', 7), 15, reorder=True)
+    assert not redundant_steps(5, ('+', 7), ('*', 3), 36, reorder=True)
+    # Whatever reorder drops going forwards, the smaller-first order gets to
+    # the same value in valid steps, or ends on an allowed number
+    operands = [1, 2, 3, 5, 7, 31]
+    for value in [1, 2, 3, 6, 12, 30, 64, 100, 1000, 1 << 20, MAX_INT-1]:
+        for _, first, a, middle in zip(*expand_values([value], operands)):
+            for _, second, b, after in zip(*expand_values([middle], operands)):
+                if after == value or not redundant_steps(value, (first, a), (second, b), after, reorder=True):
+                    continue
+                swapped = operate(second, value, b)
+                assert swapped not in {value, b} and swapped > 0
+                assert operate(first, swapped, a) == after
+                assert after not in {swapped, a} or after in operands
+
+def balance_test_1():
+    assert cheaper_forward(2, 10, 1, 10) is False
+    assert cheaper_forward(2, 10, 4, 5) is True
+    assert cheaper_forward(0, 10, 1, 10) is False
+    assert cheaper_forward(5, 10, 0, 10) is True
+    # The end alone would never find these, the start has to go first
+    assert str(ExpressionPath(minimal_solution(4, [1, 2]))) == "2+2"
+    assert str(ExpressionPath(minimal_solution(27, [2, 3, 7]))) == "3^3"
+    stats = dict()
+    assert str(ExpressionPath(minimal_solution(58759, [9, 29], stats=stats))) == "(((((9*9)*9)*9)-29)*9)-29"
+    # Strictly alternating popped 412
+    assert stats['popped'] < 412
+    # The set search's back gets past the target, and doesn't stop at the
+    # first meeting (((2*3)^2)-3 ties on sources and length)
+    stats = dict()
+    assert str(minimal_set_solution(33, [2, 3, 5, 7], 3, stats=stats)) == "((3^3)+3)+3"
+    assert stats['directions']['backward']['pushed'] > 0
+    assert stats['directions']['backward']['incumbents'] > 1
 
 def end_path_test_1():
     end_path = ExpressionEnd([], 100, 10)
@@ -1179,6 +3598,28 @@ def end_path_test_1():
     assert len(end_path) == 2
     assert str(end_path) == "(7+2)+1=10"
 
+def join_test_1():
+    path_score = functools.cmp_to_key(path_set_cmp)
+    for belts_per_source in [1, 2, 3]:
+        start_paths = [
+            ExpressionPath([(2, (None, 2)), (4, ('+', 2))], belts_per_source),
+            ExpressionPath([(1, (None, 1)), (3, ('+', 2)), (4, ('+', 1))], belts_per_source),
+            ExpressionPath([(2, (None, 2)), (4, ('*', 2))], belts_per_source),
+        ]
+        end_path = ExpressionEnd([], belts_per_source, 10)
+        end_path = end_path.appended((10, ('+', 2)), 8)
+        end_paths = [end_path.appended((8, ('*', 2)), 4), end_path.appended((8, ('+', 2)), 6).appended((6, ('+', 2)), 4)]
+        joins = [ExpressionJoined(start_path, end_path) for start_path in start_paths for end_path in end_paths]
+        for joined in joins:
+            path = joined.to_path()
+            assert joined.sources() == path.sources()
+            assert len(joined) == len(path)
+            for other in joins:
+                assert joined.better_than(other) == (path_score(path) < path_score(other.to_path()))
+        best = min(joins, key=lambda joined: path_score(joined.to_path())).to_path()
+        assert str(best_join([(start_paths, end_paths)]).to_path()) == str(best)
+    assert str(best_join([(start_paths, end_paths)]).to_path()) == "((2+2)*2)+2"
+
 def test_set_1():
     allowed_numbers = [1]
     number = 1
@@ -1252,30 +3693,345 @@ def test_set_3():
     print(result)
     assert str(result) in {"(19+19)+19"}
 
+def cost_table_test_1():
+    for allowed_numbers in [[1, 2], [1, 2, 3]]:
+        for belts_per_source in [2, 3]:
+            table = set_cost_table(60, allowed_numbers, belts_per_source)
+            assert sorted(table) == list(range(1, 61))
+            for number in range(2, 61):
+                result = minimal_set_solution(number, allowed_numbers, belts_per_source)
+                sources, path = table[number]
+                assert sources == result.sources()
+                assert str(path) == str(result)
+    allowed_numbers = [1, 2]
+    # ((1+2)+2)+2 makes 7 too, with another source
+    assert str(set_cost_table(7, allowed_numbers, 2)[7][1]) == "((1+2)*2)+1"
+    # Only what's asked for, and nothing for what can't be made
+    table = set_cost_table(None, [2], 2, max_sources=2, targets=[8, 7])
+    assert sorted(table) == [8] and 7 not in table and table.get(7) is None
+
+    table = set_cost_table(8, allowed_numbers, 100)
+    assert str(table[7][1]) == "(((2+2)^2)-2)/2"
+    assert table[7][0] == 1
+
+def cost_table_file_test_1():
+    allowed_numbers = [1, 2]
+    table = set_cost_table(12, allowed_numbers, 2)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "table.costs")
+        with CostTableFile.write(filename, dict((number, table[number][1]) for number in range(3, 9)), allowed_numbers, 2) as exported:
+            assert list(exported) == [3, 4, 5, 6, 7, 8] and len(exported) == 6
+            for number in exported:
+                assert exported[number][0] == table[number][0]
+                assert str(exported[number][1]) == str(table[number][1])
+            assert 2 not in exported and 9 not in exported and exported.path(100) is None
+            assert exported.matches([2, 1], 2) and not exported.matches(allowed_numbers, 3)
+        # Far apart targets don't take any room in between
+        far = parse_expression("((((2+2)^2)^2)^2)+1", 2)
+        with CostTableFile.write(filename, {7: table[7][1], far[-1][0]: far}, allowed_numbers, 2) as exported:
+            assert list(exported) == [7, 65537] and str(exported.path(65537)) == str(far)
+            assert 8 not in exported and 65536 not in exported and MAX_INT not in exported
+            assert os.path.getsize(filename) < 256
+        # Sources go by the table's belts_per_source, not the path's, and
+        # lengths past 16 bits fit
+        length = (1 << 16)+1
+        records = {7: CostTableFile.encode(parse_expression("((1+2)*2)+1"), 2),
+                   length: CostTableFile.RECORD.pack((1 << 15)+1, length) + struct.pack(f'<{length}I', *[1]*length) + bytes([1]*(length-1))}
+        with CostTableFile.write_records(filename, records, allowed_numbers, 2) as exported:
+            assert exported.sources(7) == 2 and exported[7][1].sources() == 2
+            assert exported.sources(length) == (1 << 15)+1 and CostTableFile.RECORD.unpack_from(exported.raw(length))[1] == length
+        # A write that fails partway leaves the old file, and nothing else
+        try:
+            with atomic_write(filename) as f:
+                f.write(b'junk')
+                raise ValueError
+        except ValueError:
+            pass
+        assert os.listdir(directory) == ["table.costs"]
+        with CostTableFile(filename) as exported:
+            assert list(exported) == [7, 65537]
+        # Shards with a gap, an overlap and a worse path for one target
+        shards = [os.path.join(directory, f"shard{index}.costs") for index in range(3)]
+        CostTableFile.write(shards[0], dict((number, table[number][1]) for number in [1, 2, 5]), allowed_numbers, 2).close()
+        CostTableFile.write(shards[1], {5: parse_expression("((1+1)+1)+2", 2), 11: table[11][1], 12: None}, allowed_numbers, 2).close()
+        CostTableFile.write(shards[2], dict((number, table[number][1]) for number in [10, 11]), allowed_numbers, 2).close()
+        assert cli(['merge', filename]+shards) == 0
+        with CostTableFile(filename) as merged:
+            assert list(merged) == [1, 2, 5, 10, 11]
+            assert str(merged.path(5)) == str(table[5][1])
+            assert merged.sources(11) == table[11][0]
+        # Resuming a batch keeps what was exported before
+        output = os.path.join(directory, "out.txt")
+        batch_solve([3, 4], allowed_numbers, 2, output, processes=1, export=filename)
+        batch_solve([3, 4, 6], allowed_numbers, 2, output, processes=1, resume=True, export=filename)
+        with CostTableFile(filename) as exported:
+            assert list(exported) == [3, 4, 6]
+            assert str(exported.path(6)) == str(minimal_set_solution(6, allowed_numbers, 2))
+
+def shared_frontier_test_1():
+    for allowed_numbers, belts_per_source, numbers in [([1, 2], 2, range(1, 61)), ([1, 2], 3, range(1, 151)),
+                                                       ([1, 2], 100, range(1, 61)), ([1, 2, 3], 3, range(1, 151))]:
+        results = dict(shared_set_solutions(numbers, allowed_numbers, belts_per_source))
+        assert sorted(results) == list(numbers)
+        for number in numbers:
+            assert str(results[number]) == str(minimal_set_solution(number, allowed_numbers, belts_per_source))
+    results = dict(shared_set_solutions([7], [1, 2], 100))
+    assert str(results[7]) == "(((2+2)^2)-2)/2"
+    assert results[7].sources() == 1
+
+def sharded_test_1():
+    for allowed_numbers in [[1, 2], [1, 2, 3], [2, 3, 5]]:
+        for belts_per_source in [1, 2, 3]:
+            for number in range(1, 41):
+                serial = minimal_set_solution(number, allowed_numbers, belts_per_source)
+                assert str(minimal_set_solution(number, allowed_numbers, belts_per_source, processes=1)) == str(serial)
+    for allowed_numbers, belts_per_source, numbers in [([1, 2], 2, range(3, 12)), ([1, 2, 3], 2, [23, 39]), ([1, 2], 100, [7, 11]), ([1, 2, 3], 9, [997]), ([9, 29], 9, [58759])]:
+        for number in numbers:
+            stats = dict()
+            sharded = minimal_set_solution(number, allowed_numbers, belts_per_source, processes=3, stats=stats)
+            assert str(sharded) == str(minimal_set_solution(number, allowed_numbers, belts_per_source))
+            assert len(stats['shards']) == 3 and stats['exchanged'] > 0
+            assert stats['popped'] == sum(shard['popped'] for shard in stats['shards'])
+    # Starting from a seed, and straight through the cache
+    seed = parse_expression("((((((1+1)+1)+1)+1)+1)+1)+1", 2)
+    assert str(sharded_set_solution(8, [1, 2], 2, processes=2, seed=seed)) == str(minimal_set_solution(8, [1, 2], 2))
+    with tempfile.TemporaryDirectory() as directory:
+        with SolutionCache(os.path.join(directory, "solutions.cache")) as cache:
+            assert str(minimal_set_solution(23, [1, 2, 3], 2, cache=cache, processes=2)) == str(minimal_set_solution(23, [1, 2, 3], 2))
+    assert str(sharded_set_solution(7, [1, 2], 2, processes=2)) == "((1+2)*2)+1"
+    assert str(sharded_set_solution(2, [1, 2], 2, processes=2)) == "2"
+    # Children going to another shard come with their path, and one that
+    # starts like an earlier one only gets the rest built
+    paths = [parse_expression(expression, 2) for expression in ["(1+2)*2", "((1+2)*2)+1"]]
+    groups = [(path, [(path[-1][0]+2, ('+', 2)), (path[-1][0]*2, ('*', 2))]) for path in paths]
+    prefixes = dict()
+    children = unpack_children(pack_children(groups), 2, prefixes=prefixes)
+    assert [str(path) for path in children] == ["((1+2)*2)+2", "((1+2)*2)*2", "(((1+2)*2)+1)+2", "(((1+2)*2)+1)*2"]
+    assert len(prefixes) == 4
+
+def cache_test_1():
+    for expression in ["1", "2+2", "(((2+2)^2)-2)/2", "((((3+3)^3)*17)+17)*17=62713"]:
+        path = parse_expression(expression, 9)
+        assert str(path) == expression.split('=')[0]
+    assert parse_expression("((((3+3)^3)*17)+17)*17")[-1][0] == 62713
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "test.cache")
+        allowed_numbers = [1, 2]
+        with SolutionCache(filename) as cache:
+            result = minimal_set_solution(7, allowed_numbers, 100, cache)
+            assert str(result) == "(((2+2)^2)-2)/2"
+            assert cache.misses == 1
+            result = minimal_set_solution(7, allowed_numbers, 100, cache)
+            assert str(result) == "(((2+2)^2)-2)/2"
+            assert result.sources() == 1
+            assert cache.hits == 1
+            result = minimal_solution(4, [1, 2, 3], cache)
+            assert str(minimal_solution(4, [1, 2, 3], cache)) == str(result)
+            # Every option still gets to the search on a miss
+            stats = dict()
+            result = minimal_set_solution(997, [1, 2, 3], 9, cache, lower_bounds=False, stats=stats, memory_limit=1)
+            uncached = dict()
+            assert str(result) == str(minimal_set_solution(997, [1, 2, 3], 9, lower_bounds=False, stats=uncached, memory_limit=1))
+            assert stats['popped'] == uncached['popped'] and 'cached' not in stats
+            stats = dict()
+            minimal_set_solution(997, [1, 2, 3], 9, cache, stats=stats)
+            assert stats == {'cached': True}
+            stats = dict()
+            minimal_solution(5, [1, 2, 3], cache, stats=stats)
+            assert 'popped' in stats
+            # A miss gives the same type a hit does
+            for solve in [lambda: minimal_solution(2, [1, 2, 3], cache), lambda: minimal_set_solution(2, [1, 2, 3], 2, cache)]:
+                missed, hit = solve(), solve()
+                assert type(missed) is type(hit) is ExpressionPath
+                assert str(missed) == str(hit) == "2"
+        # Survives reopening
+        with SolutionCache(filename) as cache:
+            assert cache.get(cache.key('set', 7, allowed_numbers, 100)) == "(((2+2)^2)-2)/2"
+            assert cache.get(cache.key('set', 7, allowed_numbers, 2)) is None
+        # Stale scoring rules throw everything away
+        with open(filename, 'r+b') as file:
+            file.seek(SolutionCache.HEADER.size - 16)
+            file.write(bytes(16))
+        with SolutionCache(filename) as cache:
+            assert cache.get(cache.key('set', 7, allowed_numbers, 100)) is None
+
+        # Bounded, so the least recently used entry gets pushed out
+        filename = os.path.join(directory, "small.cache")
+        with SolutionCache(filename, slot_count=2) as cache:
+            cache.put(('a',), "1")
+            cache.put(('b',), "2")
+            assert cache.get(('a',)) == "1"
+            cache.put(('c',), "3")
+            assert cache.get(('a',)) == "1"
+            assert cache.get(('b',)) is None
+            assert cache.get(('c',)) == "3"
+            # Starting at the same slot isn't enough, the whole digest has to match
+            key = cache.key('set', 7, allowed_numbers, 2)
+            digest = cache.key_digest(key)
+            cache.SLOT.pack_into(cache.map, next(cache.slot_offsets(digest)), digest[:8]+bytes(8), cache.tick(), 1)
+            assert cache.get(key) is None
+        assert os.path.getsize(filename) == SolutionCache.HEADER.size + 2*128
+
+def parallel_test_1():
+    allowed_numbers = [1, 2]
+    numbers = [3, 4, 5, 6, 7, 8]
+    serial = [str(minimal_set_solution(number, allowed_numbers, 100)) for number in numbers]
+    batch = list(solve_batch(numbers, allowed_numbers, 100, processes=2))
+    assert [number for number, _ in batch] == numbers
+    assert [str(path) for _, path in batch] == serial
+    assert all(path.sources() == 1 for _, path in batch)
+
+    batch = solve_batch(numbers, allowed_numbers, 100, processes=2, chunksize=2, ordered=False)
+    assert sorted((number, str(path)) for number, path in batch) == list(zip(numbers, serial))
+
+    serial = [str(minimal_solution(number, [1, 2, 3])) for number in [4, 27]]
+    assert [str(path) for _, path in solve_batch([4, 27], [1, 2, 3], processes=2)] == serial
+
+    # Way too little time to find anything
+    batch = list(solve_batch([16777216], [1, 2, 3, 4, 5, 6, 7], 100, processes=1, timeout=0.001))
+    assert batch == [(16777216, None)]
+
 def run_tests():
     path_test_1()
     path_test_2()
+    path_test_3()
 
     score_tests()
+    score_key_test_1()
     test_1()
     test_2()
     test_3()
 
-    subset_test_1()
-
     end_path_test_1()
+    join_test_1()
+    store_test_1()
+    lower_bound_test_1()
+    branch_bound_test_1()
+    stats_test_1()
+    meeting_test_1()
+    spill_test_1()
+    benchmark_test_1()
+    anytime_test_1()
+    expand_test_1()
+    balance_test_1()
+    redundant_test_1()
+    number_index_test_1()
+    pattern_db_test_1()
+    update_test_1()
+    cli_test_1()
+    verify_test_1()
+    service_test_1()
 
     test_set_1()
     test_set_2()
     test_set_3()
 
+    cost_table_test_1()
+    cost_table_file_test_1()
+    shared_frontier_test_1()
+    cache_test_1()
+    parallel_test_1()
+    sharded_test_1()
+
     print(f"ALL CURRENT TESTS PASSED! :D")
 
-def sort_by_difficulty(numbers, allowed_numbers):    
-    path_score = functools.cmp_to_key(path_cmp)
-    paths = [minimal_solution(number, allowed_numbers) for number in numbers]
+class SolveTimeout(Exception):
+    pass
+
+def raise_solve_timeout(signum, frame):
+    raise SolveTimeout()
+
+def use_operators(operator_symbols):
+    # Every solver goes by OPERATOR_SYMBOLS, this swaps which operators that
+    # is (in place, the default arguments hold onto the list) and keeps them
+    # in path_cmp's order
+    # Also what worker processes start with, they might not have been forked
+    assert set(operator_symbols) <= set(OPERATORS_BY_CODE[1:]), f"Unknown operators in {operator_symbols}"
+    OPERATOR_SYMBOLS[:] = [symbol for symbol in OPERATORS_BY_CODE[1:] if symbol in operator_symbols]
+
+def start_worker(operator_symbols):
+    # Pool initializer, workers start out with the parent's operators
+    use_operators(operator_symbols)
+
+def solve_job(job, pattern_db=None):
+    # Runs in a worker process
+    # Paths go back as strings, which are a lot smaller than a pickled
+    # ExpressionPath: that has every linked node (pickled recursively, so a
+    # long enough path hits the recursion limit) and its OperandRanks
+    target, using, belts_per_source, timeout = job
+    # Only Unix has interval timers, elsewhere targets just run to the end
+    use_timer = timeout is not None and hasattr(signal, 'setitimer')
+    if use_timer:
+        signal.signal(signal.SIGALRM, raise_solve_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        try:
+            if belts_per_source is None:
+                path = minimal_solution(target, using)
+            else:
+                path = minimal_set_solution(target, using, belts_per_source, pattern_db=pattern_db)
+        finally:
+            if use_timer:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except SolveTimeout:
+        return target, None
+    if path is None:
+        return target, None
+    return target, str(ExpressionPath(path, belts_per_source))
+
+def solve_batch(numbers, allowed_numbers, belts_per_source=None, processes=None, chunksize=None, timeout=None, ordered=True, cache=None):
+    # Spreads targets over a process pool and yields (number, path) pairs
+    # Without belts_per_source it's minimal_solution, otherwise minimal_set_solution
+    # ordered=False yields each target as soon as it's done instead of in order
+    # A target that runs past timeout seconds comes back as None
+    numbers = list(numbers)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    solver_name = 'min' if belts_per_source is None else 'set'
+    known = dict()
+    if cache is not None:
+        # The cache isn't safe to share between processes, so it stays here
+        for number in numbers:
+            expression = cache.get(cache.key(solver_name, number, allowed_numbers, belts_per_source))
+            if expression is not None:
+                known[number] = expression
+    jobs = [(number, allowed_numbers, belts_per_source, timeout) for number in numbers if number not in known]
+    if chunksize is None:
+        # Small enough chunks that a few slow targets don't leave cores idle
+        chunksize = max(1, len(jobs)//(processes*16))
+    solved = dict((number, parse_expression(expression, belts_per_source)) for number, expression in known.items())
+    if not ordered:
+        yield from solved.items()
+    next_index = 0
+    if jobs:
+        with multiprocessing.Pool(processes, start_worker, (list(OPERATOR_SYMBOLS),)) as pool:
+            mapper = pool.imap if ordered else pool.imap_unordered
+            for number, expression in mapper(solve_job, jobs, chunksize):
+                if cache is not None and expression is not None:
+                    cache.put(cache.key(solver_name, number, allowed_numbers, belts_per_source), expression)
+                path = None if expression is None else parse_expression(expression, belts_per_source)
+                if not ordered:
+                    yield number, path
+                    continue
+                # imap keeps job order, this just slots the cached ones back in
+                solved[number] = path
+                while next_index < len(numbers) and numbers[next_index] in solved:
+                    yield numbers[next_index], solved[numbers[next_index]]
+                    next_index += 1
+    if ordered:
+        for number in numbers[next_index:]:
+            yield number, solved[number]
+
+def sort_by_difficulty(numbers, allowed_numbers, cache=None, processes=None):
+    # Over a pool of processes with processes, unless there's only a few numbers
+    numbers = list(numbers)
+    if processes is not None and len(numbers) >= POOL_MIN_TARGETS:
+        paths = [path for _, path in solve_batch(numbers, allowed_numbers, processes=processes, cache=cache)]
+    else:
+        paths = [minimal_solution(number, allowed_numbers, cache) for number in numbers]
     numbers_paths = zip(numbers, paths)
-    scores = [path_score(path) for path in paths]
+    scores = [path_cmp_key(path) for path in paths]
 
     sorting_list = sorted(zip(numbers_paths, scores), key=lambda x:x[1])
     for (number, path), _ in sorting_list:
@@ -1285,12 +4041,33 @@ def sort_by_difficulty(numbers, allowed_numbers):
         
     return sorting_list
 
-def sort_by_set_difficulty(numbers, allowed_numbers, belts_per_source):
+def sort_by_set_difficulty(numbers, allowed_numbers, belts_per_source, use_cost_table=False, cache=None, processes=None, export=None):
+    # export is a filename to write every path to as a CostTableFile
+    # processes is like sort_by_difficulty's
+    numbers = list(numbers)
     t0 = time.time()
-    path_score = functools.cmp_to_key(path_set_cmp)
-    paths = [minimal_set_solution(number, allowed_numbers, belts_per_source) for number in numbers]
+    if use_cost_table:
+        # One shared_set_solutions() sweep for every number instead of one
+        # search per number
+        known = dict()
+        if cache is not None:
+            for number in numbers:
+                expression = cache.get(cache.key('set', number, allowed_numbers, belts_per_source))
+                if expression is not None:
+                    known[number] = parse_expression(expression, belts_per_source)
+        missing = [number for number in numbers if number not in known]
+        known.update(shared_set_solutions(missing, allowed_numbers, belts_per_source))
+        if cache is not None:
+            for number in missing:
+                if known[number] is not None:
+                    cache.put(cache.key('set', number, allowed_numbers, belts_per_source), str(known[number]))
+        paths = [known[number] for number in numbers]
+    elif processes is not None and len(numbers) >= POOL_MIN_TARGETS:
+        paths = [path for _, path in solve_batch(numbers, allowed_numbers, belts_per_source, processes, cache=cache)]
+    else:
+        paths = [minimal_set_solution(number, allowed_numbers, belts_per_source, cache) for number in numbers]
     numbers_paths = zip(numbers, paths)
-    scores = [path_score(path) for path in paths]
+    scores = [path.set_cmp_key() for path in paths]
     # print(paths)
     sorting_list = sorted(zip(numbers_paths, scores), key=lambda x:x[1])
     for (number, path), _ in sorting_list:
@@ -1303,11 +4080,168 @@ def sort_by_set_difficulty(numbers, allowed_numbers, belts_per_source):
     # print([i+1 for i,path in enumerate(paths) if (len(path)==1 or '+' not in operators_in_path_list(path[2:]))])
     print([len(path) for path in paths])
     print([number for (number, _), _ in sorting_list])
+    if export is not None:
+        CostTableFile.write(export, dict(zip(numbers, paths)), allowed_numbers, belts_per_source).close()
     t1 = time.time()
     print(f"That took {round(t1-t0, 3)}s total for an average of {round((t1-t0)/len(paths), 3)}s")
     return sorting_list
 
-def main(allowed_numbers, belts_per_source):
+def update_set_solutions(previous, allowed_numbers, added, belts_per_source, cache=None, pattern_db=None):
+    # previous is {number: path} from minimal_set_solution (or a cost table)
+    # with allowed_numbers, added are numbers that just got allowed
+    # Returns (solutions, changed): the same table for allowed_numbers+added
+    # and {number: (old path, new path)} for whatever got better
+    # Adding numbers can only ever make a path better, and anything better
+    # has to use one of them, so each number's old path is the incumbent for
+    # its search and everything that hasn't used a new number yet counts one
+    # more source (see require in set_solution_search)
+    # Numbers whose old path beats anything with a new number in it don't
+    # get searched again: a path of some length needs at least length/bps
+    # sources, and using a new number it has at least one unique operand and
+    # a max operand of at least min(added), so an old path that's as short
+    # as any path could be, only ever uses one number and stays below the
+    # new ones wins on path_set_cmp whatever the search would find
+    # Numbers with no old path (None) always get searched
+    using = sorted(set(allowed_numbers) | set(added))
+    max_using = using[-1]
+    min_added = min(added)
+    solutions = dict()
+    changed = dict()
+    for number, path in previous.items():
+        if cache is not None:
+            expression = cache.get(cache.key('set', number, using, belts_per_source))
+            if expression is not None:
+                solutions[number] = parse_expression(expression, belts_per_source)
+        if number not in solutions:
+            length = 1+min(min_steps(value, number, max_using) for value in using)
+            if pattern_db is not None:
+                length = max(length, pattern_db.length(number))
+            if path is not None and number not in added and path.set_cmp_key()[:4] < (-(-length // belts_per_source), length, 1, min_added):
+                solutions[number] = path
+            else:
+                solutions[number] = minimal_set_solution(number, using, belts_per_source, pattern_db=pattern_db, seed=path, require=added)
+            if cache is not None:
+                cache.put(cache.key('set', number, using, belts_per_source), str(solutions[number]))
+        if str(solutions[number]) != str(path):
+            changed[number] = (path, solutions[number])
+    return solutions, changed
+
+def benchmark_cases():
+    # (name, targets, allowed_numbers, belts_per_source), no belts_per_source
+    # means minimal_solution instead of minimal_set_solution
+    # equations.txt has the allowed numbers baked into each equation
+    cases = [
+        ('small-min', range(1, 105), [1, 2, 3, 5, 7], None),
+        ('small-set', range(1, 105), [1, 2, 3, 5, 7], 5),
+        ('small-set-wide', range(1, 105), [1, 2, 3, 4, 5, 6, 7, 8], 100),
+        ('power-min', [16777216], [1, 2, 3, 4, 5, 6, 7, 8], None),
+        ('power-set', [16777216], [1, 2, 3, 4, 5, 6, 7, 8], 100),
+        ('hard-min', [69273666], [1, 2, 3, 4, 5, 8, 17, 31], None),
+        ('hard-set', [69273666], [1, 2, 3, 4, 5, 8, 17, 31], 100),
+    ]
+    equations = os.path.join(os.path.dirname(os.path.abspath(__file__)), "equations.txt")
+    if os.path.exists(equations):
+        with open(equations) as f:
+            for index, line in enumerate(f):
+                if '=' not in line:
+                    continue
+                expression, number = line.strip().split('=')
+                allowed_numbers = sorted(set(int(operand) for operand in re.findall(r'\d+', expression)))
+                cases.append((f'equation-{index+1}-min', [int(number)], allowed_numbers, None))
+                cases.append((f'equation-{index+1}-set', [int(number)], allowed_numbers, 9))
+    return cases
+
+def benchmark_job(job):
+    # Runs in a fresh worker process so peak memory is just this case
+    name, targets, allowed_numbers, belts_per_source, timeout = job
+    use_timer = timeout is not None and hasattr(signal, 'setitimer')
+    if use_timer:
+        signal.signal(signal.SIGALRM, raise_solve_timeout)
+    result = {'seconds': 0.0, 'nodes': 0, 'timeouts': 0, 'sources': dict(), 'answers': dict()}
+    for target in targets:
+        stats = dict()
+        t0 = time.perf_counter()
+        if use_timer:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            try:
+                if belts_per_source is None:
+                    path = minimal_solution(target, allowed_numbers, stats=stats)
+                else:
+                    path = minimal_set_solution(target, allowed_numbers, belts_per_source, stats=stats)
+            finally:
+                if use_timer:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+        except SolveTimeout:
+            path = None
+            result['timeouts'] += 1
+        result['seconds'] += time.perf_counter()-t0
+        result['nodes'] += stats.get('popped', 0)
+        # JSON keys have to be strings anyway
+        if path is not None:
+            path = ExpressionPath(path, belts_per_source)
+            result['answers'][str(target)] = str(path)
+            result['sources'][str(target)] = len(path) if belts_per_source is None else path.sources()
+    result['peak_memory'] = None if resource is None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return name, result
+
+def run_benchmarks(names=None, repeat=1, timeout=60, file=None):
+    # Times every case in benchmark_cases() (or just the ones in names), each
+    # in its own process, and keeps the fastest of repeat runs
+    # timeout is per target, anything past it counts as a timeout, not a crash
+    # Returns the results as a dict, written to file as JSON if given, see
+    # compare_benchmarks() for checking two of them against each other and
+    # benchmark_summary() for printing one
+    results = {'repeat': repeat, 'timeout': timeout, 'cases': dict()}
+    for name, targets, allowed_numbers, belts_per_source in benchmark_cases():
+        if names is not None and name not in names:
+            continue
+        job = (name, list(targets), allowed_numbers, belts_per_source, timeout)
+        best = None
+        for _ in range(repeat):
+            with multiprocessing.Pool(1) as pool:
+                _, result = pool.apply(benchmark_job, (job,))
+            if best is None or result['seconds'] < best['seconds']:
+                best = result
+        results['cases'][name] = best
+    if file is not None:
+        stats_json(results, file)
+    return results
+
+def compare_benchmarks(old, new, tolerance=0.2):
+    # Everything in new that got worse than old, as a list of messages
+    # Times, nodes and memory get tolerance (a fraction) of slack since the
+    # machine isn't always the same, sources and timeouts get none
+    # old and new are run_benchmarks() results or the JSON files they wrote
+    if isinstance(old, str):
+        with open(old) as f:
+            old = json.load(f)
+    if isinstance(new, str):
+        with open(new) as f:
+            new = json.load(f)
+    regressions = []
+    for name, new_case in new['cases'].items():
+        old_case = old['cases'].get(name)
+        if old_case is None:
+            continue
+        for key in ['seconds', 'nodes', 'peak_memory']:
+            if old_case[key] is not None and new_case[key] is not None and new_case[key] > old_case[key]*(1+tolerance):
+                regressions.append(f"{name}: {key} went from {old_case[key]} to {new_case[key]}")
+        if new_case['timeouts'] > old_case['timeouts']:
+            regressions.append(f"{name}: timeouts went from {old_case['timeouts']} to {new_case['timeouts']}")
+        for target, sources in old_case['sources'].items():
+            if target not in new_case['sources']:
+                regressions.append(f"{name}: {target} wasn't solved anymore")
+            elif new_case['sources'][target] > sources:
+                regressions.append(f"{name}: {target} went from {old_case['answers'][target]} to {new_case['answers'][target]}")
+    return regressions
+
+def benchmark_summary(results):
+    # One line per case of a run_benchmarks() result, for printing
+    return [f"{name}: {round(case['seconds'], 3)}s, {case['nodes']} nodes, {case['timeouts']} timeouts, peak {case['peak_memory']}"
+            for name, case in results['cases'].items()]
+
+def main(allowed_numbers, belts_per_source, cache=None, budget=None, pattern_db=None):
     user_input = ""
     while not user_input.isdigit():
         user_input = input("Please enter an integer >> ").strip()
@@ -1320,13 +4254,518 @@ def main(allowed_numbers, belts_per_source):
     # test_div(allowed_numbers)
     # solution = minimal_solution(number, allowed_numbers)
     t0 = time.time()
-    solution = minimal_set_solution(number, allowed_numbers, belts_per_source)
+    if pattern_db is not None:
+        # pattern_db is a filename, built the first time (takes a few seconds)
+        pattern_db = PatternDatabase.load(pattern_db, allowed_numbers)
+    if budget is None:
+        solution = minimal_set_solution(number, allowed_numbers, belts_per_source, cache, pattern_db=pattern_db)
+    else:
+        # Rounds of budget seconds, showing the best so far after each one
+        search = AnytimeSearch(number, allowed_numbers, belts_per_source, pattern_db=pattern_db)
+        while True:
+            solution, lower_bound, gap = search.run(seconds=budget)
+            if search.done:
+                break
+            print(f"Best so far: {solution} (at least {lower_bound} sources, could be {gap} too many)")
+            if input("Keep going? [y/N] >> ").strip().lower() != "y":
+                break
+        if search.done and solution is not None and cache is not None:
+            cache.put(cache.key('set', number, allowed_numbers, belts_per_source), str(solution))
     t1 = time.time()
+    if pattern_db is not None:
+        pattern_db.close()
     print(f"Calculation took {round(t1-t0, 3)} seconds")
     if solution != None:
         print(f"Solution found")
         print(str(solution))
 
+def parse_numbers(text):
+    # "1-9, 11 13..20" -> [1, ..., 9, 11, 13, ..., 20], ranges include both
+    # ends and anything after a # is a comment
+    numbers = []
+    for token in re.split(r'[\s,]+', text.split('#')[0].strip()):
+        if not token:
+            continue
+        match = re.fullmatch(r'(\d+)(?:-|\.\.)(\d+)', token)
+        if match:
+            numbers.extend(range(int(match[1]), int(match[2])+1))
+        else:
+            numbers.append(int(token))
+    return numbers
+
+def solution_record(target, path):
+    # What batch_solve() and SolverService give back for a target, path is
+    # None if it couldn't be made (or ran out of time)
+    record = {'target': target, 'expression': None if path is None else str(path)}
+    if path is not None:
+        record['length'] = len(path)
+        if path.belts_per_source is not None:
+            record['sources'] = path.sources()
+    return record
+
+def format_solution(target, path, output_format='equations'):
+    # One line of batch_solve() output, "expression=target" like
+    # equations.txt or a JSON object from solution_record()
+    if output_format == 'equations':
+        return f"{path}={target}"
+    return json.dumps(solution_record(target, path))
+
+def finished_targets(filename):
+    # Targets already written to a batch_solve() output file, in either format
+    # A line cut off partway by whatever stopped the last run gets dropped
+    # from the file, so appending to it carries on cleanly
+    if not os.path.exists(filename):
+        return set()
+    with open(filename, 'r+b') as f:
+        data = f.read()
+        end = data.rfind(b'\n')+1
+        f.truncate(end)
+    done = set()
+    for line in data[:end].decode().splitlines():
+        line = line.strip()
+        if line.startswith('{'):
+            done.add(json.loads(line)['target'])
+        elif '=' in line:
+            done.add(int(line.rsplit('=', 1)[1]))
+    return done
+
+def batch_solve(targets, allowed_numbers, belts_per_source=None, output=None, output_format='equations', processes=None, timeout=None, cache=None, resume=False, export=None):
+    # solve_batch() for the command line, every target gets written to output
+    # (a filename, stdout without one) as soon as it's solved, one line each
+    # in output_format (see format_solution)
+    # With resume, targets already in output get skipped and the rest are
+    # added on the end, so a long run that got stopped just carries on
+    # Returns how many got solved and the ones that didn't (those never get
+    # written, so resuming tries them again)
+    # export is a filename to write every solved target to as a
+    # CostTableFile at the end, with resume it keeps what's already in it
+    done = finished_targets(output) if resume and output is not None else set()
+    solutions = dict()
+    targets = [target for target in dict.fromkeys(targets) if target not in done]
+    solved = 0
+    unsolved = []
+    with open(output, 'a' if resume else 'w') if output is not None else contextlib.nullcontext(sys.stdout) as f:
+        for target, path in solve_batch(targets, allowed_numbers, belts_per_source, processes, timeout=timeout, ordered=False, cache=cache):
+            if path is None:
+                unsolved.append(target)
+                continue
+            f.write(format_solution(target, path, output_format)+'\n')
+            f.flush()
+            solved += 1
+            if export is not None:
+                solutions[target] = path
+    if export is not None:
+        if resume and os.path.exists(export):
+            with CostTableFile(export) as table:
+                assert table.matches(allowed_numbers, belts_per_source), f"{export} is for other settings"
+                solutions = dict((target, table.path(target)) for target in table if target not in solutions) | solutions
+        CostTableFile.write(export, solutions, allowed_numbers, belts_per_source).close()
+    return solved, unsolved
+
+# What verify_lines() expects an expression to be once the brackets are gone,
+# and what it splits one up by
+EXPRESSION_CHAIN = re.compile(r'\d+(?:[-+*/^]\d+)*')
+EXPRESSION_OPERATOR = re.compile(r'([-+*/^])')
+EXPRESSION_BRACKETS = str.maketrans('', '', '() \t')
+
+def verify_lines(lines, belts_per_source=None, allowed_numbers=None, first_line=1, keep=False):
+    # Evaluates equations.txt lines (expression=target, the target optional)
+    # or batch_solve() jsonl records with operate(), so clamping, subtraction
+    # that can't go below 1 and inexact division all count the way the game
+    # does them
+    # Problems are 'unparsable', 'operator' (not in OPERATOR_SYMBOLS),
+    # 'operand' (not in allowed_numbers, if given), 'value' (doesn't make the
+    # target) and 'sources' (a jsonl record's sources are off for
+    # belts_per_source)
+    # Returns how many lines got checked, [(line number, problem, line)] and,
+    # with keep, [(target, expression, sources)] for every line that passed
+    allowed = None if allowed_numbers is None else set(allowed_numbers)
+    operators = set(OPERATOR_SYMBOLS)
+    checked = 0
+    mismatches = []
+    verified = []
+    for line_number, line in enumerate(lines, first_line):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        checked += 1
+        recorded_sources = None
+        try:
+            if line.startswith('{'):
+                record = json.loads(line)
+                expression, target, recorded_sources = record['expression'], record.get('target'), record.get('sources')
+            else:
+                expression, _, target = line.partition('=')
+                target = int(target) if target else None
+            expression = expression.strip()
+            bare = expression.translate(EXPRESSION_BRACKETS)
+            if not EXPRESSION_CHAIN.fullmatch(bare):
+                raise ValueError(bare)
+            tokens = EXPRESSION_OPERATOR.split(bare)
+            operands = list(map(int, tokens[::2]))
+            if min(operands) <= 0:
+                raise ValueError(bare)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            mismatches.append((line_number, 'unparsable', line))
+            continue
+        if not operators.issuperset(tokens[1::2]):
+            mismatches.append((line_number, 'operator', line))
+            continue
+        if allowed is not None and not allowed.issuperset(operands):
+            mismatches.append((line_number, 'operand', line))
+            continue
+        value = operands[0]
+        for operator, operand in zip(tokens[1::2], operands[1:]):
+            value = operate(operator, value, operand)
+        if target is not None and value != target:
+            mismatches.append((line_number, 'value', line))
+            continue
+        sources = None
+        if belts_per_source is not None:
+            sources = sum(-(-operands.count(operand) // belts_per_source) for operand in set(operands))
+            if recorded_sources is not None and recorded_sources != sources:
+                mismatches.append((line_number, 'sources', line))
+                continue
+        if keep:
+            verified.append((value, expression, sources))
+    return checked, mismatches, verified
+
+def verify_job(job):
+    # Runs in a worker process, one chunk of lines
+    return verify_lines(*job)
+
+def verify_expressions(filename, belts_per_source=None, allowed_numbers=None, processes=None, cache=None, chunk_lines=1<<16):
+    # verify_lines() over a whole file (- for stdin), read chunk_lines at a
+    # time so it never has to fit in memory, over a process pool if processes
+    # is given
+    # Every line that passes gets put in cache (with allowed_numbers as the
+    # key's numbers), it's only checked to be right, so it should come from a
+    # solver run with the same settings
+    # Yields (line number, problem, line) for every mismatch, returns how
+    # many lines got checked
+    assert cache is None or allowed_numbers is not None
+    solver_name = 'min' if belts_per_source is None else 'set'
+    with open(filename) if filename != '-' else contextlib.nullcontext(sys.stdin) as f:
+        def jobs():
+            first_line = 1
+            while lines := list(itertools.islice(f, chunk_lines)):
+                yield lines, belts_per_source, allowed_numbers, first_line, cache is not None
+                first_line += len(lines)
+        with multiprocessing.Pool(processes, start_worker, (list(OPERATOR_SYMBOLS),)) if processes is not None else contextlib.nullcontext() as pool:
+            checked = 0
+            for count, mismatches, verified in (pool.imap(verify_job, jobs()) if pool is not None else map(verify_job, jobs())):
+                checked += count
+                yield from mismatches
+                for target, expression, _ in verified:
+                    cache.put(cache.key(solver_name, target, allowed_numbers, belts_per_source), expression)
+    return checked
+
+# Pattern databases a SolverService worker has open, by filename
+WORKER_PATTERNS = dict()
+
+def service_job(job):
+    # Runs in a SolverService worker, which keeps its pattern databases open
+    # from one request to the next
+    target, using, belts_per_source, operator_symbols, timeout, patterns = job
+    use_operators(operator_symbols)
+    if patterns is not None and patterns not in WORKER_PATTERNS:
+        WORKER_PATTERNS[patterns] = PatternDatabase(patterns)
+    return solve_job((target, using, belts_per_source, timeout), WORKER_PATTERNS.get(patterns))
+
+def pattern_job(job):
+    filename, using, operator_symbols = job
+    use_operators(operator_symbols)
+    PatternDatabase.load(filename, using).close()
+    return filename
+
+class SolverService:
+    # The solver as a long running service, see serve()
+    # Requests are JSON, one per line: {"target": 123} or {"targets": [...]}
+    # with "allowed", optionally "belts" (minimal_solution without it),
+    # "operators", "timeout" and an "id" that comes back with every answer
+    # Each target gets its own solution_record() line as soon as it's done
+    # Searches run in a process pool, and what it's worked out stays warm per
+    # configuration (allowed numbers, belts per source, operators): answers
+    # it's given before, searches still going (asking again just waits on
+    # them) and, with patterns (a directory), a PatternDatabase per
+    # configuration that every worker keeps open
+    # Answers go in cache too, it's only ever used from the event loop
+    MEMO_SIZE = 1 << 16
+
+    def __init__(self, processes=None, cache=None, patterns=None, timeout=None):
+        # Forked workers would hold onto every connection open at the time
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else None)
+        self.pool = concurrent.futures.ProcessPoolExecutor(processes, context, start_worker, (list(OPERATOR_SYMBOLS),))
+        self.cache = cache
+        self.patterns = patterns
+        self.timeout = timeout
+        # configuration -> {target: expression}
+        self.solved = dict()
+        # (configuration, target) -> future of its expression
+        self.running = dict()
+        # configuration -> future of its pattern database's filename
+        self.pattern_files = dict()
+
+    @staticmethod
+    def configuration(request):
+        using = tuple(sorted(set(int(number) for number in request['allowed'])))
+        if not using or using[0] < 1:
+            raise ValueError("allowed has to be positive numbers")
+        belts_per_source = request.get('belts')
+        operator_symbols = request.get('operators', ''.join(OPERATORS_BY_CODE[1:]))
+        if not set(operator_symbols) <= set(OPERATORS_BY_CODE[1:]):
+            raise ValueError(f"Unknown operators in {operator_symbols}")
+        operator_symbols = ''.join(symbol for symbol in OPERATORS_BY_CODE[1:] if symbol in operator_symbols)
+        return using, None if belts_per_source is None else int(belts_per_source), operator_symbols
+
+    def cache_key(self, configuration, target):
+        using, belts_per_source, operator_symbols = configuration
+        return self.cache.key('min' if belts_per_source is None else 'set', target, using, belts_per_source, operator_symbols)
+
+    async def pattern_file(self, configuration):
+        using, belts_per_source, operator_symbols = configuration
+        if self.patterns is None or belts_per_source is None:
+            return None
+        # One file whatever belts_per_source is, see PatternDatabase
+        key = (using, operator_symbols)
+        if key not in self.pattern_files:
+            name = hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+            job = (os.path.join(self.patterns, f"{name}.patterns"), list(using), operator_symbols)
+            self.pattern_files[key] = asyncio.get_running_loop().run_in_executor(self.pool, pattern_job, job)
+        return await self.pattern_files[key]
+
+    async def solve(self, configuration, target, timeout=None):
+        # The expression for target, or None
+        solved = self.solved.setdefault(configuration, dict())
+        if target in solved:
+            return solved[target]
+        if self.cache is not None:
+            expression = self.cache.get(self.cache_key(configuration, target))
+            if expression is not None:
+                return self.remember(configuration, target, expression)
+        if (configuration, target) not in self.running:
+            self.running[(configuration, target)] = asyncio.ensure_future(self.run(configuration, target, timeout))
+        # Shielded, one request going away doesn't cancel it for the rest
+        return await asyncio.shield(self.running[(configuration, target)])
+
+    async def run(self, configuration, target, timeout):
+        using, belts_per_source, operator_symbols = configuration
+        try:
+            patterns = await self.pattern_file(configuration)
+            job = (target, list(using), belts_per_source, operator_symbols, timeout, patterns)
+            _, expression = await asyncio.get_running_loop().run_in_executor(self.pool, service_job, job)
+        finally:
+            del self.running[(configuration, target)]
+        if expression is None:
+            # Could've just run out of time, so it gets another go next time
+            return None
+        if self.cache is not None:
+            self.cache.put(self.cache_key(configuration, target), expression)
+        return self.remember(configuration, target, expression)
+
+    def remember(self, configuration, target, expression):
+        solved = self.solved[configuration]
+        if len(solved) >= self.MEMO_SIZE:
+            # Oldest first
+            del solved[next(iter(solved))]
+        solved[target] = expression
+        return expression
+
+    async def answer(self, line, writer, lock):
+        request = {}
+        try:
+            request = json.loads(line)
+            configuration = self.configuration(request)
+            targets = [int(target) for target in request['targets']] if 'targets' in request else [int(request['target'])]
+            timeout = request.get('timeout', self.timeout)
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            await self.reply(writer, lock, {'id': request.get('id') if isinstance(request, dict) else None, 'error': str(error)})
+            return
+        async def answer_target(target):
+            try:
+                expression = await self.solve(configuration, target, timeout)
+            except Exception as error:
+                record = {'target': target, 'error': repr(error)}
+            else:
+                record = solution_record(target, None if expression is None else parse_expression(expression, configuration[1]))
+            record['id'] = request.get('id')
+            await self.reply(writer, lock, record)
+        await asyncio.gather(*[answer_target(target) for target in dict.fromkeys(targets)])
+
+    async def reply(self, writer, lock, record):
+        async with lock:
+            writer.write((json.dumps(record)+'\n').encode())
+            await writer.drain()
+
+    async def handle(self, reader, writer):
+        # Every line is its own request, all of them run at once
+        lock = asyncio.Lock()
+        answers = set()
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    answer = asyncio.ensure_future(self.answer(line, writer, lock))
+                    answers.add(answer)
+                    answer.add_done_callback(answers.discard)
+            await asyncio.gather(*answers)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, path=None, port=None):
+        # A Unix socket at path, or localhost:port (0 picks a free one)
+        if path is not None:
+            if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+                # Left over from a service that didn't get to clean up
+                os.unlink(path)
+            return await asyncio.start_unix_server(self.handle, path)
+        return await asyncio.start_server(self.handle, '127.0.0.1', port)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def serve(path=None, port=None, processes=None, cache=None, patterns=None, timeout=None):
+    # Runs a SolverService until it gets SIGINT or SIGTERM
+    async def run(service):
+        server = await service.start(path, port)
+        stop = asyncio.Event()
+        for signal_number in [signal.SIGINT, signal.SIGTERM]:
+            # Windows event loops can't, Ctrl+C still gets through there
+            with contextlib.suppress(NotImplementedError):
+                asyncio.get_running_loop().add_signal_handler(signal_number, stop.set)
+        address = path if path is not None else f"localhost:{server.sockets[0].getsockname()[1]}"
+        print(f"Solving on {address}", file=sys.stderr)
+        async with server:
+            await stop.wait()
+    with SolverService(processes, cache, patterns, timeout) as service:
+        try:
+            asyncio.run(run(service))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if path is not None and os.path.exists(path):
+                os.unlink(path)
+
+def query(request, path=None, port=None):
+    # Sends request (see SolverService) to a running serve() and yields its
+    # answers as they come back
+    count = len(set(request['targets'])) if 'targets' in request else 1
+    if path is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = path
+    else:
+        connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = ('127.0.0.1', port)
+    with connection:
+        connection.connect(address)
+        connection.sendall((json.dumps(request)+'\n').encode())
+        with connection.makefile('r') as f:
+            for _ in range(count):
+                line = f.readline()
+                if not line:
+                    break
+                answer = json.loads(line)
+                yield answer
+                if 'target' not in answer:
+                    # The request itself was wrong
+                    break
+
+def cli(argv=None):
+    # python make_number.py solve|serve|query ..., see --help
+    parser = argparse.ArgumentParser(prog="make_number.py", description="Ways to make numbers in Beltmatic")
+    commands = parser.add_subparsers(dest='command', required=True)
+    def add_configuration(command):
+        command.add_argument('--allowed', type=parse_numbers, required=True, help="allowed numbers, ex. 1-9,11")
+        command.add_argument('--belts', type=int, help="belts per source, fewest sources instead of fewest operations")
+        command.add_argument('--operators', default=''.join(OPERATORS_BY_CODE[1:]), help="operators that can be used, ex. +*-")
+    def add_address(command):
+        address = command.add_mutually_exclusive_group(required=True)
+        address.add_argument('--socket', help="Unix socket path")
+        address.add_argument('--port', type=int, help="localhost port")
+    solve = commands.add_parser('solve', help="solve every target in a file, as they're done")
+    solve.add_argument('targets', nargs='?', default='-', help="file with targets, any number per line or ranges like 1-100 (- for stdin)")
+    add_configuration(solve)
+    solve.add_argument('-o', '--output', help="file to write to instead of stdout")
+    solve.add_argument('--format', choices=['equations', 'jsonl'], default='equations')
+    solve.add_argument('--resume', action='store_true', help="skip targets already in --output and add to it")
+    solve.add_argument('--processes', type=int)
+    solve.add_argument('--timeout', type=float, help="seconds per target")
+    solve.add_argument('--cache', help="SolutionCache file")
+    solve.add_argument('--export', help="CostTableFile to write every solved target to")
+    service = commands.add_parser('serve', help="keep a solver running for query")
+    add_address(service)
+    service.add_argument('--processes', type=int)
+    service.add_argument('--timeout', type=float, help="seconds per target, unless a request says otherwise")
+    service.add_argument('--cache', help="SolutionCache file")
+    service.add_argument('--patterns', help="directory for pattern databases")
+    verify = commands.add_parser('verify', help="check every expression in an equations.txt or jsonl file")
+    verify.add_argument('expressions', nargs='?', default='-', help="file to check (- for stdin)")
+    verify.add_argument('--allowed', type=parse_numbers, help="numbers the expressions may use")
+    verify.add_argument('--belts', type=int, help="belts per source to count sources with")
+    verify.add_argument('--operators', default=''.join(OPERATORS_BY_CODE[1:]), help="operators that can be used, ex. +*-")
+    verify.add_argument('--processes', type=int)
+    verify.add_argument('--cache', help="SolutionCache file to put every correct line in, needs --allowed")
+    merge = commands.add_parser('merge', help="put cost tables from separate runs together")
+    merge.add_argument('output')
+    merge.add_argument('tables', nargs='+')
+    ask = commands.add_parser('query', help="ask a running serve")
+    ask.add_argument('targets', nargs='+', type=parse_numbers)
+    add_configuration(ask)
+    add_address(ask)
+    ask.add_argument('--timeout', type=float, help="seconds per target")
+    args = parser.parse_args(argv)
+
+    if args.command == 'query':
+        request = {'targets': [target for targets in args.targets for target in targets], 'allowed': args.allowed, 'operators': args.operators}
+        if args.belts is not None:
+            request['belts'] = args.belts
+        if args.timeout is not None:
+            request['timeout'] = args.timeout
+        failed = False
+        for answer in query(request, args.socket, args.port):
+            print(json.dumps(answer))
+            failed = failed or 'error' in answer
+        return 1 if failed else 0
+    if args.command == 'merge':
+        with CostTableFile.merge(args.output, args.tables) as table:
+            if len(table):
+                print(f"{len(table)} targets from {table.target(0)} to {table.target(len(table)-1)}", file=sys.stderr)
+        return 0
+    with SolutionCache(args.cache) if args.cache is not None else contextlib.nullcontext() as cache:
+        if args.command == 'serve':
+            serve(args.socket, args.port, args.processes, cache, args.patterns, args.timeout)
+            return 0
+        use_operators(args.operators)
+        if args.command == 'verify':
+            if cache is not None and args.allowed is None:
+                parser.error("--cache needs --allowed")
+            search = verify_expressions(args.expressions, args.belts, args.allowed, args.processes, cache)
+            mismatched = 0
+            while True:
+                try:
+                    line_number, problem, line = next(search)
+                except StopIteration as stop:
+                    checked = stop.value
+                    break
+                print(f"{line_number}: {problem}: {line}")
+                mismatched += 1
+            print(f"Checked {checked}, {mismatched} wrong", file=sys.stderr)
+            return 1 if mismatched else 0
+        if args.resume and args.output is None:
+            parser.error("--resume needs --output")
+        with open(args.targets) if args.targets != '-' else contextlib.nullcontext(sys.stdin) as f:
+            targets = [target for line in f for target in parse_numbers(line)]
+        solved, unsolved = batch_solve(targets, args.allowed, args.belts, args.output, args.format, args.processes, args.timeout, cache, args.resume, args.export)
+        print(f"Solved {solved}, {len(unsolved)} without a solution{':' if unsolved else ''} {' '.join(map(str, unsolved))}".rstrip(), file=sys.stderr)
+        return 0
+
 def replace_base(lst, base) -> int:
     step = 0
     result = 0
@@ -1336,6 +4775,8 @@ def replace_base(lst, base) -> int:
     return result
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(cli())
     nonexistent = {10}
     max_num = 39
     # max_num = 2
@@ -1348,7 +4789,12 @@ if __name__ == "__main__":
     numbers = [i+1 for i in range(0, 104)]# if i+1 not in allowed_numbers]
     # print(numbers, allowed_numbers)
     run_tests()
-    # main(allowed_numbers, belts_per_source)
-    # sort_by_difficulty(numbers, allowed_numbers)
-    sort_by_set_difficulty(numbers, allowed_numbers, belts_per_source)
+    with SolutionCache(os.path.join(os.path.dirname(os.path.abspath(__file__)), "solutions.cache")) as cache:
+        # main(allowed_numbers, belts_per_source, cache)
+        # main(allowed_numbers, belts_per_source, cache, pattern_db="patterns.db")
+        # print('\n'.join(benchmark_summary(run_benchmarks(file="benchmark.json"))))
+        # print('\n'.join(compare_benchmarks("benchmark_old.json", "benchmark.json")))
+        # sort_by_difficulty(numbers, allowed_numbers, cache)
+        # solutions, changed = update_set_solutions(dict(number_path for number_path, _ in sort_by_set_difficulty(numbers, allowed_numbers, belts_per_source)), allowed_numbers, [10], belts_per_source, cache)
+        sort_by_set_difficulty(numbers, allowed_numbers, belts_per_source, use_cost_table=True, cache=cache)
     # test_div(allowed_numbers, 2000)